@@ -1,53 +1,130 @@
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
 import json
 import os
+import random
+import threading
+import time
+
+# Exercise bank rotation policy
+BANK_MIN_SIZE = 3        # Keep generating until a point has this many exercises
+BANK_MAX_SIZE = 20       # Size cap per grammar point (older/most-used are evicted)
+BANK_FRESH_RATE = 0.1    # Chance of generating a fresh exercise once the bank is warm
+
+# Model discovery cache (shared by every tutor in the process)
+MODEL_CACHE_TTL = 3600        # seconds a discovered model name stays valid
+MODEL_FAILURE_TTL = 60        # retry discovery sooner after list_models() failed
+FALLBACK_MODEL = 'gemini-pro'
+
+# Priority list (Try all Flash variants first)
+MODEL_PRIORITIES = [
+    'gemini-2.5-flash',
+    'gemini-2.0-flash',
+    'models/gemini-2.5-flash', # Some APIs use models/ prefix
+    'models/gemini-2.0-flash',
+    'gemini-1.5-flash', 
+    'gemini-1.5-flash-001', 
+    'gemini-1.5-flash-latest', 
+    'gemini-1.5-flash-8b',
+    'gemini-1.5-pro',
+    'gemini-1.5-pro-001'
+]
+
+_model_cache = {}  # api_key -> (model_name or None, expires_at)
+_model_cache_lock = threading.Lock()
+
+
+def _client_options(api_key):
+    # Keys are bound per client: genai.configure() is process-global, and tutors for
+    # different keys (sessions) run side by side
+    return {"api_key": api_key}
+
+
+def _discover_model(api_key):
+    """Calls list_models() and picks the best available model. Returns (name, ttl)."""
+    try:
+        # Dynamic Model Selection
+        client = glm.ModelServiceClient(client_options=_client_options(api_key))
+        valid_models = [
+            m.name for m in genai.list_models(client=client)
+            if 'generateContent' in m.supported_generation_methods
+        ]
+        selected_model = None
+        
+        for p in MODEL_PRIORITIES:
+            # Check for exact or close match (some apis return models/gemini-1.5-flash-001)
+            matches = [vm for vm in valid_models if p in vm]
+            if matches:
+                selected_model = matches[0] # Pick the first match (usually latest)
+                break
+        
+        if not selected_model and valid_models:
+            selected_model = valid_models[0] # Fallback to anything available
+        
+        if selected_model:
+            print(f"Selected Model: {selected_model}")
+        else:
+            print("No valid generation models found.")
+        return selected_model, MODEL_CACHE_TTL
+            
+    except Exception as e:
+        print(f"Model selection error: {e}")
+        return FALLBACK_MODEL, MODEL_FAILURE_TTL # Hard fallback 
+
+
+def resolve_model_name(api_key):
+    """Model name for an API key, discovered at most once per TTL per process."""
+    now = time.monotonic()
+    with _model_cache_lock:
+        cached = _model_cache.get(api_key)
+        if cached and cached[1] > now:
+            return cached[0]
+
+    # Discovery is a network call: run it outside the lock so other keys are not held up
+    model_name, ttl = _discover_model(api_key)
+    with _model_cache_lock:
+        _model_cache[api_key] = (model_name, now + ttl)
+    return model_name
+
+
+def invalidate_model_cache(api_key=None):
+    """Forget discovered models (for one key, or all) so the next call re-discovers."""
+    with _model_cache_lock:
+        if api_key is None:
+            _model_cache.clear()
+        else:
+            _model_cache.pop(api_key, None)
+
 
 class AITutor:
     def __init__(self, api_key=None):
         self.api_key = api_key
+        self._model = None
+        self._model_name = None
+        self._client = None
         if self.api_key:
-            genai.configure(api_key=self.api_key)
-            try:
-                # Dynamic Model Selection
-                valid_models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-                
-                # Priority list (Try all Flash variants first)
-                priorities = [
-                    'gemini-2.5-flash',
-                    'gemini-2.0-flash',
-                    'models/gemini-2.5-flash', # Some APIs use models/ prefix
-                    'models/gemini-2.0-flash',
-                    'gemini-1.5-flash', 
-                    'gemini-1.5-flash-001', 
-                    'gemini-1.5-flash-latest', 
-                    'gemini-1.5-flash-8b',
-                    'gemini-1.5-pro',
-                    'gemini-1.5-pro-001'
-                ]
-                selected_model = None
-                
-                for p in priorities:
-                    # Check for exact or close match (some apis return models/gemini-1.5-flash-001)
-                    matches = [vm for vm in valid_models if p in vm]
-                    if matches:
-                        selected_model = matches[0] # Pick the first match (usually latest)
-                        break
-                
-                if not selected_model and valid_models:
-                    selected_model = valid_models[0] # Fallback to anything available
-                
-                if selected_model:
-                    self.model = genai.GenerativeModel(selected_model)
-                    print(f"Selected Model: {selected_model}")
-                else:
-                    self.model = None
-                    print("No valid generation models found.")
-                    
-            except Exception as e:
-                print(f"Model selection error: {e}")
-                self.model = genai.GenerativeModel('gemini-pro') # Hard fallback 
-        else:
-            self.model = None
+            self._client = glm.GenerativeServiceClient(client_options=_client_options(self.api_key))
+
+    @property
+    def model(self):
+        """GenerativeModel for the cached model name (rebuilt only when the name changes)."""
+        if not self.api_key:
+            return None
+        model_name = resolve_model_name(self.api_key)
+        if model_name != self._model_name:
+            model = genai.GenerativeModel(model_name) if model_name else None
+            if model:
+                model._client = self._client  # otherwise it uses the process-global default client
+            self._model = model
+            self._model_name = model_name
+        return self._model
+
+    def _on_model_error(self, error):
+        """Drop the cached model selection after a failed call (model may be gone/renamed)."""
+        if isinstance(error, ValueError):
+            return # Bad JSON from a working model, not a model failure
+        print(f"Model call failed, invalidating model cache: {error}")
+        invalidate_model_cache(self.api_key)
 
     def generate_lesson_content(self, grammar_point):
         """
@@ -56,7 +133,8 @@ class AITutor:
         concept = grammar_point['grammar_concept']
         meaning = grammar_point.get('meaning', '')
         
-        if not self.model:
+        model = self.model
+        if not model:
             # Fallback for no API key
             return {
                 "question": f"請使用「{concept}」造一個與日常與生活相關的句子。\n(請在左側 Sidebar 輸入 API Key 以啟用 AI 題目生成)",
@@ -83,22 +161,54 @@ class AITutor:
                 "example_sentence": "The correct Japanese sentence"
             }}
             """
-            response = self.model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+            response = model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
             return json.loads(response.text)
         except Exception as e:
+            self._on_model_error(e)
             return {
                 "question": f"請造句 using: {concept} (AI 生成失敗: {str(e)})",
                 "hint": "",
                 "context": "Error Fallback"
             }
 
+    def get_lesson_content(self, grammar_point, db):
+        """
+        Serves a lesson from the exercise bank, generating a fresh one only occasionally.
+
+        Exercises rotate least-recently-shown first. A fresh exercise is generated
+        while the bank is small, with probability BANK_FRESH_RATE afterwards, or
+        when the bank is empty; successful generations are stored for reuse.
+        """
+        grammar_id = grammar_point['grammar_id']
+        bank_size = db.count_exercises(grammar_id)
+
+        wants_fresh = bank_size < BANK_MIN_SIZE or random.random() < BANK_FRESH_RATE
+        content = None
+        if self.model and wants_fresh:
+            content = self.generate_lesson_content(grammar_point)
+            if content.get('example_sentence'):
+                content['exercise_id'] = db.add_exercise(
+                    grammar_id, content, max_per_point=BANK_MAX_SIZE, shown=True
+                )
+                return content
+
+        exercise = db.next_exercise(grammar_id)
+        if exercise:
+            return exercise
+
+        # Empty bank: reuse the failed attempt's fallback rather than calling the model again
+        if content is not None:
+            return content
+        return self.generate_lesson_content(grammar_point)
+
     def evaluate_response(self, user_input, grammar_point):
         """
         Evaluates the user's sentence.
         """
         concept = grammar_point['grammar_concept']
         
-        if not self.model:
+        model = self.model
+        if not model:
             return {
                 "feedback": "請輸入 API Key 來啟用 AI 批改功能。",
                 "correction": "無法連線至 AI。",
@@ -127,10 +237,11 @@ class AITutor:
                 "score": 3
             }}
             """
-            response = self.model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+            response = model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
             return json.loads(response.text)
         except Exception as e:
-             return {
+            self._on_model_error(e)
+            return {
                 "feedback": f"AI 分析發生錯誤: {str(e)}",
                 "correction": None,
                 "better_sentence": None,
@@ -1,14 +1,15 @@
 import streamlit as st
 import pandas as pd
+import io
 import json
 import os
-import time
-import uuid
-import shutil
 from datetime import datetime
 import audio_manager
+import progress_io
+import lesson_pipeline
 from database_manager import DatabaseManager
-from srs_engine import SRSEngine
+from review_writer import ReviewWriteBuffer
+from srs_engine import SRSEngine, get_scheduler
 from ai_tutor import AITutor
 from dotenv import load_dotenv
 
@@ -18,6 +19,9 @@ load_dotenv()
 if not os.path.exists(audio_manager.OUTPUT_DIR):
     os.makedirs(audio_manager.OUTPUT_DIR, exist_ok=True)
 
+# Clips held in memory for the feedback player (one copy per process, not per session)
+AUDIO_MEMORY_CLIPS = int(os.getenv("AUDIO_MEMORY_CLIPS", "64"))
+
 
 # Page Configuration
 st.set_page_config(
@@ -63,48 +67,87 @@ if not check_password():
     st.stop()  # Do not continue if password is not correct
 
 
+# --- SHARED RESOURCES ---
+@st.cache_resource(show_spinner=False)
+def get_database():
+    """One DatabaseManager (and its connection pool) shared by all sessions."""
+    return DatabaseManager()
+
+@st.cache_resource(show_spinner=False)
+def get_review_writer():
+    """Write-behind buffer for ratings, shared by all sessions (replays its journal on start)."""
+    return ReviewWriteBuffer(get_database())
+
+@st.cache_resource(show_spinner=False, max_entries=AUDIO_MEMORY_CLIPS)
+def load_audio_bytes(audio_path):
+    """
+    mp3 bytes of a cached clip, read once and shared by all sessions and reruns.
+    Clip paths are content-addressed, so an entry never goes stale.
+    """
+    with open(audio_path, 'rb') as audio_file:
+        return audio_file.read()
+
+
 # --- SIDEBAR & SETUP ---
 with st.sidebar:
     st.title("🇯🇵 AI 日語導師")
     
     # API Key Input
+    # Used by this session only; never written to the (process-wide) environment
     api_key = st.text_input("🔑 Gemini API Key", type="password", help="請輸入 Google Gemini API Key 以啟用 AI 功能")
     
-    if api_key:
-        os.environ["GEMINI_API_KEY"] = api_key
-    
     menu = st.radio("功能選單", ["📚 學習與複習", "📊 學習數據", "🗂️ 文法庫"])
     
+    # Queue mode: easiest level first, or a single level only
+    level_choice = st.selectbox("📖 學習範圍", ["全部 (N5→N1)", "N5", "N4", "N3", "N2", "N1"])
+    study_level = None if level_choice.startswith("全部") else level_choice
+    
     st.divider()
     
     # Backup Section
     st.write("### 💾 資料備份")
     
     # Export Progress
+    # Streams grammar points, progress and review logs as gzip-compressed NDJSON.
+    # For a known device only the changes it has not confirmed yet are exported.
+    peers = progress_io.get_sync_peers(get_database())
+    export_target = st.selectbox(
+        "匯出範圍",
+        ["完整備份"] + [peer['device_id'] for peer in peers],
+        format_func=lambda target: target if target == "完整備份" else f"增量同步至 {target}"
+    )
     if st.button("📤 匯出學習進度"):
-        export_data = st.session_state.db.export_progress()
-        export_json = json.dumps(export_data, ensure_ascii=False, indent=2)
+        get_review_writer().flush()
+        since = 0 if export_target == "完整備份" else progress_io.peer_watermark(get_database(), export_target)
+        export_buffer = io.BytesIO()
+        counts = progress_io.export_ndjson(get_database(), export_buffer, since=since)
+        kind = "backup" if since == 0 else "delta"
         
         st.download_button(
-            label="⬇️ 下載 JSON 檔案",
-            data=export_json,
-            file_name=f"japanese_progress_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-            mime="application/json"
+            label="⬇️ 下載備份檔案",
+            data=export_buffer.getvalue(),
+            file_name=f"japanese_progress_{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson.gz",
+            mime="application/gzip"
         )
-        st.success(f"✅ 已準備 {export_data['total_items']} 筆記錄")
+        st.success(f"✅ 已準備 {counts['progress']} 筆進度、{counts['log']} 筆複習紀錄")
     
-    # Import Progress
-    uploaded_file = st.file_uploader("📥 匯入學習進度", type=['json'])
+    # Import Progress (NDJSON backup, or the legacy JSON export)
+    uploaded_file = st.file_uploader("📥 匯入學習進度", type=['gz', 'ndjson', 'json'])
     if uploaded_file is not None:
         try:
-            import_data = json.load(uploaded_file)
-            result = st.session_state.db.import_progress(import_data)
+            get_review_writer().flush()
+            if uploaded_file.name.endswith('.json'):
+                import_data = json.load(uploaded_file)
+                result = get_database().import_progress(import_data)
+            else:
+                result = progress_io.import_ndjson(get_database(), uploaded_file)
             
             st.success(f"""
             ✅ 匯入完成！
             - 新增：{result['added']} 筆
             - 更新：{result['updated']} 筆
             - 跳過：{result['skipped']} 筆
+            - 複習紀錄：{result.get('logs_added', 0)} 筆
             """)
             st.rerun()
         except Exception as e:
@@ -122,54 +165,47 @@ with st.sidebar:
 
 # Initialize Components
 if 'db' not in st.session_state:
-    st.session_state.db = DatabaseManager()
+    st.session_state.db = get_database()
+    get_review_writer()  # Replays reviews journaled by a crashed process
     
-    # Check for seed data and import (only if database is empty)
+    # Load seed data in one transaction (files unchanged since the last load are skipped)
     try:
-        # Check if database already has data
-        conn = st.session_state.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM grammar_points')
-        existing_count = cursor.fetchone()[0]
-        conn.close()
+        seed_files = [
+            'seed_data.json', 
+            'grammar_n4.json', 
+            'grammar_n3.json', 
+            'grammar_n2.json', 
+            'grammar_n1.json'
+        ]
+        loaded = st.session_state.db.seed_from_files(
+            [os.path.join(os.path.dirname(__file__), filename) for filename in seed_files]
+        )
         
-        # Only import if database is empty
-        if existing_count == 0:
-            # Define seed files to look for
-            seed_files = [
-                'seed_data.json', 
-                'grammar_n4.json', 
-                'grammar_n3.json', 
-                'grammar_n2.json', 
-                'grammar_n1.json'
-            ]
-            
-            imported_count = 0
-            for filename in seed_files:
-                seed_path = os.path.join(os.path.dirname(__file__), filename)
-                if os.path.exists(seed_path):
-                    with open(seed_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        for item in data:
-                            st.session_state.db.add_grammar_point(
-                                item['level'], item['concept'], item['meaning'], 
-                                item['structure'], item['explanation'], item.get('tags', '')
-                            )
-                        imported_count += 1
-            
-            if imported_count > 0:
-                st.toast(f"✅ 已導入 {imported_count} 個文法資料檔", icon="📚")
+        if loaded:
+            st.toast(f"✅ 已導入 {len(loaded)} 個文法資料檔（新增 {sum(loaded.values())} 個文法）", icon="📚")
 
     except Exception as e:
         st.error(f"資料庫匯入錯誤: {e}")
 
-# Initialize AI with key from input or env
-current_api_key = api_key or os.getenv("GEMINI_API_KEY")
-st.session_state.ai = AITutor(api_key=current_api_key)
+@st.cache_resource(show_spinner=False)
+def get_tutor(api_key):
+    """One shared AITutor per API key for the whole process (survives reruns and sessions)."""
+    return AITutor(api_key=api_key)
+
+@st.cache_resource(show_spinner=False)
+def server_api_key():
+    """Key configured in the environment when the server started (shared by all sessions)."""
+    return os.getenv("GEMINI_API_KEY")
+
+# Initialize AI with this session's key, or the server's
+current_api_key = api_key or server_api_key()
+st.session_state.ai = get_tutor(current_api_key)
 
 # Session State for Review Flow
 if 'review_queue' not in st.session_state:
     st.session_state.review_queue = [] # List of prepared cards
+if 'producer' not in st.session_state:
+    st.session_state.producer = None # Background card generator (survives reruns)
 if 'current_card' not in st.session_state:
     st.session_state.current_card = None
 if 'review_step' not in st.session_state:
@@ -181,11 +217,14 @@ if 'last_user_input' not in st.session_state:
 
 # --- FUNCTIONS ---
 def prepare_session():
-    """Fetches due items and pre-generates AI content for all of them."""
+    """Fetches due items and starts generating AI content for them in the background."""
     
     # 1. Fetch Candidates
+    # Make sure buffered ratings are in the DB before picking due cards
+    get_review_writer().flush()
+    
     # We fetch up to 10 items for a batch session
-    reviews_data = st.session_state.db.get_due_reviews()
+    reviews_data = st.session_state.db.get_due_reviews(level=study_level)
     candidates = reviews_data['reviews'] + reviews_data['new']
     candidates = candidates[:10] # Limit batch size
     
@@ -193,94 +232,131 @@ def prepare_session():
         st.toast("目前沒有需要複習的內容！", icon="🎉")
         return
 
-    # 2. Batch Generation Loop
-    progress_text = "AI 正在為您準備課程中... 請稍候"
-    my_bar = st.progress(0, text=progress_text)
+    # 2. Start Background Generation
+    # Cards are generated concurrently behind the scenes; we only wait for the first one.
+    if st.session_state.producer:
+        st.session_state.producer.cancel()
     
-    prepared_cards = []
+    st.session_state.review_queue = []
+    st.session_state.producer = lesson_pipeline.SessionProducer(
+        st.session_state.ai,
+        candidates,
+        max_workers=lesson_pipeline.MAX_WORKERS,
+        timeout=lesson_pipeline.CARD_TIMEOUT,
+        db=st.session_state.db
+    ).start()
     
-    for i, card in enumerate(candidates):
-        # Update progress bar
-        percent = int(((i) / len(candidates)) * 100)
-        my_bar.progress(percent, text=f"正在生成第 {i+1}/{len(candidates)} 題: {card['grammar_concept']}...")
-        
-        # Generate AI Content
-        try:
-            ai_content = st.session_state.ai.generate_lesson_content(card)
-            
-            # Generate Audio for the Answer (Japanese)
-            target_sentence = ai_content.get('example_sentence', ai_content.get('question', ''))
-            
-            # Use content-based hash for filename (same sentence = same file)
-            import hashlib
-            audio_key = hashlib.md5(target_sentence.encode('utf-8')).hexdigest()
-            audio_filename = f"{audio_key}.mp3"
-            
-            # Ensure we are generating for Japanese text
-            audio_path = audio_manager.generate_audio(target_sentence, audio_filename)
-            ai_content['audio_path'] = audio_path
-            
-            card.update(ai_content)
-            prepared_cards.append(card)
-        except Exception as e:
-            print(f"Error generating card {card['grammar_concept']}: {e}")
-            # Skip failed cards or add fallback? 
-            # Current logic in ai_tutor returns a fallback dictionary on error, so it's safe.
-            card.update({"question": "AI 生成失敗", "hint": "", "context": "Error"})
-            prepared_cards.append(card)
-            
-    my_bar.progress(100, text="準備完成！")
-    time.sleep(0.5)
-    my_bar.empty()
-    
-    # 3. Update State
-    st.session_state.review_queue = prepared_cards
+    # 3. Show the first card as soon as it is ready
     load_next_from_queue()
 
+def sync_review_queue():
+    """Moves cards finished by the background producer into the review queue."""
+    producer = st.session_state.producer
+    if producer:
+        st.session_state.review_queue.extend(producer.take_ready())
+
+def remaining_cards():
+    """Cards left in this session (ready + still generating)."""
+    producer = st.session_state.producer
+    return len(st.session_state.review_queue) + (producer.pending if producer else 0)
+
 def load_next_from_queue():
-    """Pops the next card from the review queue."""
+    """Pops the next card from the review queue, waiting for the producer if needed."""
+    sync_review_queue()
+    producer = st.session_state.producer
+    if not st.session_state.review_queue and producer and producer.pending:
+        with st.spinner("AI 正在準備下一題... 請稍候"):
+            while not st.session_state.review_queue and producer.pending:
+                producer.wait_next(timeout=lesson_pipeline.CARD_TIMEOUT)
+                sync_review_queue()
+    
     if st.session_state.review_queue:
         st.session_state.current_card = st.session_state.review_queue.pop(0)
         st.session_state.review_step = 'question'
         st.session_state.last_feedback = None
         st.session_state.last_user_input = ""
+        # Start voicing this card and the next few while the learner answers
+        if producer:
+            producer.audio.advance(st.session_state.current_card.get('session_index', 0))
     else:
-        st.session_state.current_card = None
+        end_session()
+
+def end_session():
+    """Clears the current card and stops any audio still being prefetched."""
+    if st.session_state.producer:
+        st.session_state.producer.cancel()
+    st.session_state.current_card = None
+    st.session_state.producer = None
+
+def card_audio_path(card):
+    """Audio for the card on screen; normally already rendered by the prefetcher."""
+    if not card.get('audio_path'):
+        producer = st.session_state.producer
+        if producer:
+            card['audio_path'] = producer.audio.path(card)
+        else:
+            card['audio_path'] = audio_manager.generate_audio(lesson_pipeline.audio_text(card))
+    return card['audio_path']
+
+def card_audio_bytes(card):
+    """mp3 bytes for the card on screen; a clip evicted since it was rendered is rendered again."""
+    for _ in range(2):
+        audio_path = card_audio_path(card)
+        if not audio_path:
+            return None
+        try:
+            # Shared in-process copy: reruns neither touch the disk nor copy the clip
+            return load_audio_bytes(audio_path)
+        except OSError:
+            card['audio_path'] = None  # evicted meanwhile
+    return None
+
+def due_counts_with_pending(start_date, end_date):
+    """Per-day due counts from the DB plus ratings still waiting in the write buffer."""
+    counts = st.session_state.db.get_due_counts(start_date, end_date)
+    for day, count in get_review_writer().pending_due_counts().items():
+        counts[day] = counts.get(day, 0) + count
+    return counts
 
 def process_rating(quality):
     card = st.session_state.current_card
     
-    # Calculate SRS update
-    result = SRSEngine.calculate_review(
-        quality, 
-        card['repetition'], 
-        card['efactor'], 
-        card['interval']
-    )
+    # Calculate SRS update (SM-2 by default, FSRS via SRS_SCHEDULER=fsrs)
+    result = get_scheduler(os.getenv("SRS_SCHEDULER", "sm2")).schedule(card, quality)
+    
+    # Spread due dates over the least-loaded day in the fuzz window (SRS_LOAD_BALANCE=0 disables)
+    if os.getenv("SRS_LOAD_BALANCE", "1") == "1":
+        result = SRSEngine.load_balance(result, due_counts_with_pending)
     
-    # Update DB
-    st.session_state.db.update_progress(
+    # Update DB (buffered; flushed in batches and at session end)
+    get_review_writer().submit(
         card['progress_id'],
         card['grammar_id'],
         quality,
         result['interval'],
         result['efactor'],
         result['repetition'],
-        result['next_review_date']
+        result['next_review_date'],
+        stability=result.get('stability'),
+        difficulty=result.get('difficulty')
     )
     
     # Load next
-    if st.session_state.review_queue:
-        st.toast(f"已記錄！剩餘 {len(st.session_state.review_queue)} 題", icon="✅")
+    if remaining_cards():
+        st.toast(f"已記錄！剩餘 {remaining_cards()} 題", icon="✅")
         load_next_from_queue()
         st.rerun()
     else:
+        get_review_writer().flush()
         st.balloons()
-        st.session_state.current_card = None # End state
+        end_session()
         st.rerun()
 
 # --- MAIN PAGE ---
 
+# Pick up any cards the background producer finished since the last rerun
+sync_review_queue()
+
 if menu == "📚 學習與複習":
     st.header("練習室")
     
@@ -298,7 +374,7 @@ if menu == "📚 學習與複習":
         
         # Progress (Queue based)
         # Note: We don't know total initial size here unless we stored it, but simple remaining count is fine
-        st.caption(f"本輪剩餘題目: {len(st.session_state.review_queue) + 1}")
+        st.caption(f"本輪剩餘題目: {remaining_cards() + 1}")
         
         with st.container(border=True):
             st.subheader(f"{card['grammar_concept']}")
@@ -349,14 +425,14 @@ if menu == "📚 學習與複習":
                     st.code(feedback['correction'], language='text')
 
                  # Audio Player (Correct Answer)
-                if card.get('audio_path'):
-                     if os.path.exists(card['audio_path']):
+                if card.get('audio_key'):
+                     with st.spinner("語音準備中..."):
+                         audio_bytes = card_audio_bytes(card)
+                     if audio_bytes:
                          st.markdown("### 🔊 發音示範")
-                         with open(card['audio_path'], 'rb') as audio_file:
-                            audio_bytes = audio_file.read()
                          st.audio(audio_bytes, format="audio/mp3")
                      else:
-                         st.error(f"⚠️ 找不到語音檔: {card['audio_path']}")
+                         st.error("⚠️ 語音生成失敗")
                 else:
                     st.warning("⚠️ 此題目未生成語音")
                 
@@ -387,7 +463,7 @@ if menu == "📚 學習與複習":
         st.subheader("準備好開始學習了嗎？")
         
         # Check pending reviews
-        reviews_data = st.session_state.db.get_due_reviews()
+        reviews_data = st.session_state.db.get_due_reviews(level=study_level)
         total_due = len(reviews_data['reviews']) + len(reviews_data['new'])
         
         col1, col2, col3 = st.columns(3)
@@ -423,7 +499,6 @@ elif menu == "📊 學習數據":
 
 elif menu == "🗂️ 文法庫":
     st.header("文法知識庫")
-    conn = st.session_state.db.get_connection()
-    df = pd.read_sql("SELECT * FROM grammar_points", conn)
+    with st.session_state.db.connection() as conn:
+        df = pd.read_sql("SELECT * FROM grammar_points", conn)
     st.dataframe(df)
-    conn.close()
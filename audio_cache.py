@@ -0,0 +1,232 @@
+"""
+Size-bounded audio cache.
+
+Clips live in a sharded layout (temp_audio/ab/cd/<key>.mp3) so no single
+directory grows huge. A small SQLite index next to them records each clip's
+voice, size, creation / last-use time and hit count, and is used to keep the
+cache under a byte budget by evicting least-recently (LRU) or
+least-frequently (LFU) used clips.
+
+Clips are written to a temporary file in the same shard and renamed into
+place, so a half-written mp3 is never visible under its final name.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+CACHE_DIR = "temp_audio"
+INDEX_NAME = "index.db"
+MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+POLICY = os.getenv("AUDIO_CACHE_POLICY", "lru")  # 'lru' or 'lfu'
+
+# Evict down to this fraction of the budget, so eviction does not run on every write
+LOW_WATERMARK = 0.9
+# Clips used this recently are never evicted (they may be on screen right now)
+PROTECT_SECONDS = 300
+
+EVICTION_ORDER = {
+    "lru": "last_used_at, hits",
+    "lfu": "hits, last_used_at",
+}
+
+
+class AudioCache:
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES, policy=POLICY):
+        if policy not in EVICTION_ORDER:
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.policy = policy
+        os.makedirs(self.root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._evicting = False
+        self._conn = sqlite3.connect(os.path.join(self.root, INDEX_NAME), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        with self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS clips (
+                    key TEXT PRIMARY KEY,
+                    voice TEXT,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_clips_lru ON clips (last_used_at, hits)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_clips_lfu ON clips (hits, last_used_at)')
+        # Running size of all indexed clips: summed once here, then kept up to date on write / evict
+        self._bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM clips').fetchone()[0]
+
+        self._adopt_flat_files()
+
+    # --- Layout ---
+
+    def path_for(self, key):
+        """Final (sharded) path of a clip."""
+        return os.path.join(self.root, key[:2], key[2:4], f"{key}.mp3")
+
+    def partial_path(self, key):
+        """A unique temporary path in the clip's shard, for writers."""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"{path}.{uuid.uuid4().hex}.part"
+
+    def _adopt_flat_files(self):
+        """Move clips from the old flat layout (temp_audio/<md5>.mp3) into shards."""
+        for name in os.listdir(self.root):
+            if not name.endswith(".mp3"):
+                continue
+            key = name[:-4]
+            source = os.path.join(self.root, name)
+            target = self.path_for(key)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(source, target)
+            self._index(key, None, os.path.getsize(target))
+
+    # --- Index ---
+
+    def _index(self, key, voice, size):
+        with self._lock:
+            self._record(key, voice, size)
+
+    def _record(self, key, voice, size):
+        """Index a clip (caller holds the lock)."""
+        now = time.time()
+        previous = self._conn.execute('SELECT size FROM clips WHERE key = ?', (key,)).fetchone()
+        with self._conn:
+            self._conn.execute('''
+                INSERT INTO clips (key, voice, size, created_at, last_used_at, hits)
+                VALUES (?, ?, ?, ?, ?, 0)
+                ON CONFLICT(key) DO UPDATE SET
+                    voice = COALESCE(excluded.voice, voice), size = excluded.size,
+                    last_used_at = excluded.last_used_at
+            ''', (key, voice, size, now, now))
+        self._bytes += size - (previous[0] if previous else 0)
+
+    def contains(self, key):
+        """True if the clip is cached (not counted as a use)."""
+        return os.path.exists(self.path_for(key))
+
+    def get(self, key):
+        """
+        Path of a cached clip (counted as a hit), or None.
+        """
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return None
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'UPDATE clips SET hits = hits + 1, last_used_at = ? WHERE key = ?', (time.time(), key)
+            )
+            indexed = cursor.rowcount
+        if not indexed:
+            # File present but unknown to the index (e.g. index deleted)
+            self._index(key, None, os.path.getsize(path))
+        return path
+
+    def commit(self, key, partial_path, voice=None):
+        """
+        Atomically publish a fully written temporary file as the clip for `key`.
+
+        Returns:
+            str: Final path.
+        """
+        path = self.path_for(key)
+        size = os.path.getsize(partial_path)
+        # Under the lock, so a running eviction cannot delete the clip between rename and index
+        with self._lock:
+            os.replace(partial_path, path)
+            self._record(key, voice, size)
+            over_budget = self._bytes > self.max_bytes and not self._evicting
+            if over_budget:
+                self._evicting = True
+        if over_budget:
+            # Called on the TTS event loop: evict on a worker thread instead
+            threading.Thread(target=self._evict_in_background, name="audio-cache-evict", daemon=True).start()
+        return path
+
+    def total_bytes(self):
+        with self._lock:
+            return self._bytes
+
+    def stats(self):
+        with self._lock:
+            count, size, hits = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM clips'
+            ).fetchone()
+        return {"clips": count, "bytes": size, "hits": hits, "max_bytes": self.max_bytes, "policy": self.policy}
+
+    # --- Eviction ---
+
+    def _evict_in_background(self):
+        try:
+            self.evict()
+        except Exception as e:
+            print(f"[AudioCache] Eviction failed: {e}")
+        finally:
+            with self._lock:
+                self._evicting = False
+
+    def evict(self, target_bytes=None):
+        """
+        Delete clips in policy order until the cache fits `target_bytes`
+        (default: the low watermark of the budget).
+
+        Returns:
+            int: Number of clips removed.
+        """
+        target = target_bytes if target_bytes is not None else int(self.max_bytes * LOW_WATERMARK)
+        protected_since = time.time() - PROTECT_SECONDS
+
+        with self._lock:
+            excess = self._bytes - target
+            if excess <= 0:
+                return 0
+
+            # Running total over the eviction order: take the shortest prefix that frees enough space
+            victims = self._conn.execute(f'''
+                SELECT key, size FROM (
+                    SELECT key, size, SUM(size) OVER (ORDER BY {EVICTION_ORDER[self.policy]}, key) - size AS freed_before
+                    FROM clips
+                    WHERE last_used_at < ?
+                )
+                WHERE freed_before < ?
+            ''', (protected_since, excess)).fetchall()
+
+            removed = []
+            for key, size in victims:
+                try:
+                    os.remove(self.path_for(key))
+                except FileNotFoundError:
+                    pass
+                removed.append((key,))
+                self._bytes -= size
+            with self._conn:
+                self._conn.executemany('DELETE FROM clips WHERE key = ?', removed)
+
+        if removed:
+            print(f"[AudioCache] Evicted {len(removed)} clips ({self.policy})")
+        return len(removed)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_audio_cache():
+    """The process-wide audio cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AudioCache()
+        return _cache
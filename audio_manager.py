@@ -1,56 +1,227 @@
 import edge_tts
 import asyncio
+import atexit
+import hashlib
+import heapq
+import itertools
+import json
 import os
-import nest_asyncio
+import threading
+import unicodedata
+from concurrent.futures import Future
 
-# Apply nest_asyncio to allow nested event loops in Streamlit
-nest_asyncio.apply()
+from audio_cache import CACHE_DIR, get_audio_cache
 
-OUTPUT_DIR = "temp_audio"
+OUTPUT_DIR = CACHE_DIR
+DEFAULT_VOICE = "ja-JP-NanamiNeural"
 
-if not os.path.exists(OUTPUT_DIR):
-    os.makedirs(OUTPUT_DIR)
+# Concurrent syntheses on the shared event loop, and the limit for one synthesis
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "4"))
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "30"))
 
-async def _generate_worker(text, filename, voice):
+# Lower runs first; audio someone is waiting for right now beats prefetching
+PRIORITY_NOW = 0
+
+# Options passed through to edge_tts.Communicate; all of them are part of the cache key
+SYNTHESIS_OPTIONS = ("rate", "volume", "pitch")
+# Bump to invalidate every cached clip (e.g. after changing normalization)
+KEY_VERSION = 1
+
+
+def normalize_text(text):
+    """The text that is actually synthesized: NFKC with collapsed whitespace."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def audio_key(text, voice=DEFAULT_VOICE, **options):
+    """
+    Content address of a clip: a hash of the normalized text, the voice and
+    the synthesis options, so changing any of them never serves stale audio.
     """
-    Async worker to communicate with Edge TTS service.
+    unknown = set(options) - set(SYNTHESIS_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown synthesis options: {sorted(unknown)}")
+    payload = json.dumps({
+        "version": KEY_VERSION,
+        "text": normalize_text(text),
+        "voice": voice,
+        "options": {name: value for name, value in options.items() if value is not None},
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSService:
     """
-    print(f"[Audio] Starting generation for: {text[:15]}...")
-    communicate = edge_tts.Communicate(text, voice)
-    await communicate.save(filename)
-    print(f"[Audio] File saved: {filename}")
+    Renders Edge TTS on one background event-loop thread.
 
-def generate_audio(text, filename, voice="ja-JP-NanamiNeural"):
+    Any thread (the Streamlit script thread, lesson workers) can submit jobs
+    and gets a concurrent.futures.Future back; up to `max_concurrency`
+    syntheses run at the same time on the loop, and queued ones start in
+    priority order. Clips are stored in the size-bounded AudioCache under
+    their audio_key(); concurrent requests for the same key share one
+    synthesis.
     """
-    Synchronous wrapper for generating audio.
+
+    def __init__(self, max_concurrency=TTS_CONCURRENCY, timeout=TTS_TIMEOUT, cache=None):
+        self.cache = cache or get_audio_cache()
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        # Synthesis slots; only touched on the loop thread
+        self._active = 0
+        self._waiting = []  # heap of (priority, order, waiter)
+        self._order = itertools.count()
+        self._started = threading.Event()
+        self._inflight = {}  # key -> [Future of the synthesis in progress, number of requests]
+        self._inflight_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run_loop, name="tts-loop", daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    async def _acquire(self, priority):
+        if self._active < self.max_concurrency and not self._waiting:
+            self._active += 1
+            return
+        waiter = self.loop.create_future()
+        heapq.heappush(self._waiting, (priority, next(self._order), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before the cancel landed
+                self._release()
+            raise
+
+    def _release(self):
+        while self._waiting:
+            _, _, waiter = heapq.heappop(self._waiting)
+            if not waiter.done():
+                waiter.set_result(None)  # pass the slot on directly
+                return
+        self._active -= 1
+
+    async def _render(self, text, key, voice, options, priority):
+        await self._acquire(priority)
+        try:
+            cached = self.cache.get(key)
+            if cached:
+                return cached
+            print(f"[Audio] Starting generation for: {text[:15]}...")
+            # Written under a temporary name so a failed synthesis never leaves a partial mp3
+            partial_path = self.cache.partial_path(key)
+            try:
+                communicate = edge_tts.Communicate(text, voice, **options)
+                await asyncio.wait_for(communicate.save(partial_path), self.timeout)
+                filepath = self.cache.commit(key, partial_path, voice)
+            finally:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+            print(f"[Audio] File saved: {filepath}")
+            return filepath
+        finally:
+            self._release()
+
+    def submit(self, text, voice=DEFAULT_VOICE, priority=PRIORITY_NOW, **options):
+        """
+        Queue one synthesis (options: see SYNTHESIS_OPTIONS).
+
+        Returns:
+            Future: resolves to the absolute mp3 path (raises on failure).
+        """
+        key = audio_key(text, voice, **options)
+        cached = self.cache.get(key)
+        if cached:
+            print(f"[Audio] Cache hit, reusing: {key}")
+            future = Future()
+            future.set_result(cached)
+            return future
+
+        with self._inflight_lock:
+            entry = self._inflight.get(key)
+            if entry is not None:
+                print(f"[Audio] Already rendering, sharing: {key}")
+                entry[1] += 1
+                return entry[0]
+            options = {name: value for name, value in options.items() if value is not None}
+            future = asyncio.run_coroutine_threadsafe(
+                self._render(normalize_text(text), key, voice, options, priority), self.loop
+            )
+            self._inflight[key] = [future, 1]
+        # Outside the lock: runs immediately if the future is already done
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def cancel(self, key):
+        """
+        Withdraw one request for `key`. The synthesis is stopped only once
+        every request sharing it has been withdrawn.
+
+        Returns:
+            bool: True if the synthesis was cancelled.
+        """
+        with self._inflight_lock:
+            entry = self._inflight.get(key)
+            if entry is None:
+                return False
+            entry[1] -= 1
+            if entry[1] > 0:
+                return False
+            future = entry[0]
+        return future.cancel()
+
+    def _forget(self, key, future):
+        with self._inflight_lock:
+            entry = self._inflight.get(key)
+            if entry is not None and entry[0] is future:
+                del self._inflight[key]
+
+    def submit_batch(self, jobs):
+        """Queue (text[, voice]) jobs; returns their futures in the same order."""
+        return [self.submit(*job) for job in jobs]
+
+    def close(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_tts_service():
+    """The process-wide TTS service (started on first use)."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TTSService()
+            atexit.register(_service.close)
+        return _service
+
+
+def generate_audio_async(text, voice=DEFAULT_VOICE, **options):
+    """Non-blocking: returns a Future for the mp3 path."""
+    return get_tts_service().submit(text, voice, **options)
+
+
+def generate_audio(text, voice=DEFAULT_VOICE, **options):
+    """
+    Synchronous wrapper for generating audio (blocks the calling thread only).
+
+    Returns:
+        str: Absolute mp3 path, or None on failure.
     """
-    filepath = os.path.join(OUTPUT_DIR, filename)
-    abs_filepath = os.path.abspath(filepath)
-    
-    # Check if audio file already exists
-    if os.path.exists(abs_filepath):
-        print(f"[Audio] File already exists, reusing: {filename}")
-        return abs_filepath
-    
-    print(f"[Audio] Request: {text[:20]} -> {filename}")
-    
+    print(f"[Audio] Request: {text[:20]} ({voice})")
     try:
-        # With nest_asyncio, we can typically just call asyncio.run() 
-        # or use the current loop safely.
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            print("[Audio] Using existing loop")
-            loop.run_until_complete(_generate_worker(text, abs_filepath, voice))
-        else:
-            print("[Audio] Creating new loop")
-            asyncio.run(_generate_worker(text, abs_filepath, voice))
-             
-        if os.path.exists(abs_filepath):
-            return abs_filepath
-        else:
-            print("[Audio] Error: File not found after generation attempt.")
-            return None
-            
+        return generate_audio_async(text, voice, **options).result()
     except Exception as e:
         print(f"[Audio] Critical Error: {e}")
         return None
@@ -0,0 +1,252 @@
+"""
+資料庫線上備份 (SQLite Online Backup API)
+
+在應用程式運作中也能安全備份：
+- 以 sqlite3 backup API 複製：WAL 模式下一次讀取完整快照（讀取不會阻擋寫入）；
+  非 WAL 時分頁複製，每一步只短暫持有讀取鎖，讓寫入可以穿插進行
+- 快照先寫入暫存檔並檢查完整性，再以 gzip 壓縮、原子性改名
+- 保留策略：保留最新 N 份，加上最近 D 天每天一份
+- 還原：解壓後同樣透過 backup API 寫回正在使用的資料庫
+
+Usage:
+    python backup_manager.py create --label manual
+    python backup_manager.py list
+    python backup_manager.py prune --keep-last 5 --keep-daily 7
+    python backup_manager.py restore backups/knowledge_base_20260101_120000_manual.db.gz
+"""
+
+import argparse
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+from database_manager import DB_PATH, BUSY_TIMEOUT_MS
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(os.path.dirname(__file__), "backups"))
+KEEP_LAST = int(os.getenv("BACKUP_KEEP_LAST", "5"))
+KEEP_DAILY = int(os.getenv("BACKUP_KEEP_DAILY", "7"))
+
+# Without WAL: pages copied per backup step (4 KiB pages -> 4 MiB), and the
+# pause between steps that lets writers in.
+PAGES_PER_STEP = 1024
+STEP_SLEEP = 0.005
+
+BACKUP_PATTERN = re.compile(r"^knowledge_base_(\d{8}_\d{6})(?:_([\w-]+))?\.db\.gz$")
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT_MS)}")
+    return conn
+
+
+def _copy_database(source, target, pages=PAGES_PER_STEP, sleep=STEP_SLEEP, progress=None):
+    """
+    Copy through the backup API (source/target are open connections).
+
+    Under WAL the whole copy runs as one read transaction: it sees a fixed
+    snapshot and never blocks writers. With a rollback journal a reader does
+    block writers, so the copy is done in steps of `pages` with a pause in
+    between (SQLite restarts the copy if another connection writes meanwhile).
+    """
+    def report(status, remaining, total):
+        if progress:
+            progress(total - remaining, total)
+
+    journal_mode = source.execute("PRAGMA journal_mode").fetchone()[0]
+    if journal_mode.lower() == "wal":
+        pages = -1
+    source.backup(target, pages=pages, progress=report, sleep=sleep)
+
+
+def _check_integrity(conn):
+    result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    if result != "ok":
+        raise sqlite3.DatabaseError(f"Integrity check failed: {result}")
+
+
+def create_backup(db_path=DB_PATH, backup_dir=BACKUP_DIR, label="manual",
+                  pages=PAGES_PER_STEP, sleep=STEP_SLEEP, progress=None):
+    """
+    Take a consistent, gzip-compressed snapshot of a live database.
+
+    Args:
+        label (str): Short tag stored in the file name (e.g. 'before_cleanup').
+        progress (callable): Optional progress(copied_pages, total_pages).
+
+    Returns:
+        str: Path of the new backup file.
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(db_path)
+    os.makedirs(backup_dir, exist_ok=True)
+
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    label = re.sub(r"[^\w-]", "_", label) if label else ""
+    name = f"knowledge_base_{stamp}_{label}.db.gz" if label else f"knowledge_base_{stamp}.db.gz"
+    final_path = os.path.join(backup_dir, name)
+
+    fd, snapshot_path = tempfile.mkstemp(suffix=".db", dir=backup_dir)
+    os.close(fd)
+    try:
+        source = _connect(db_path)
+        target = sqlite3.connect(snapshot_path)
+        try:
+            _copy_database(source, target, pages, sleep, progress)
+            # Self-contained file: no -wal alongside the snapshot
+            target.execute("PRAGMA journal_mode = DELETE")
+            _check_integrity(target)
+        finally:
+            target.close()
+            source.close()
+
+        partial_path = final_path + ".tmp"
+        with open(snapshot_path, 'rb') as src, gzip.open(partial_path, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(partial_path, final_path)
+    finally:
+        for path in (snapshot_path, final_path + ".tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    return final_path
+
+
+def list_backups(backup_dir=BACKUP_DIR):
+    """
+    Backups in a directory, newest first.
+
+    Returns:
+        list: dicts with path, created (datetime), label and size (bytes)
+    """
+    if not os.path.isdir(backup_dir):
+        return []
+    backups = []
+    for name in os.listdir(backup_dir):
+        match = BACKUP_PATTERN.match(name)
+        if not match:
+            continue
+        path = os.path.join(backup_dir, name)
+        backups.append({
+            "path": path,
+            "created": datetime.strptime(match.group(1), '%Y%m%d_%H%M%S'),
+            "label": match.group(2) or "",
+            "size": os.path.getsize(path)
+        })
+    backups.sort(key=lambda b: b['created'], reverse=True)
+    return backups
+
+
+def apply_retention(backup_dir=BACKUP_DIR, keep_last=KEEP_LAST, keep_daily=KEEP_DAILY, now=None):
+    """
+    Delete backups outside the retention policy: the newest `keep_last`
+    backups are kept, plus the newest backup of each of the last `keep_daily` days.
+
+    Returns:
+        list: Paths that were removed.
+    """
+    now = now or datetime.now()
+    backups = list_backups(backup_dir)
+
+    keep = {b['path'] for b in backups[:keep_last]}
+    seen_days = set()
+    for backup in backups:
+        day = backup['created'].date()
+        if (now.date() - day).days < keep_daily and day not in seen_days:
+            seen_days.add(day)
+            keep.add(backup['path'])
+
+    removed = []
+    for backup in backups:
+        if backup['path'] not in keep:
+            os.remove(backup['path'])
+            removed.append(backup['path'])
+    return removed
+
+
+def restore_backup(backup_path, db_path=DB_PATH, backup_dir=BACKUP_DIR, safety_backup=True):
+    """
+    Restore a backup into the (possibly open) database.
+
+    The snapshot is decompressed and checked first, then written through the
+    backup API so other connections see the restored data consistently.
+    The current database is backed up first (label 'before_restore').
+
+    Returns:
+        str: Path of the safety backup, or None.
+    """
+    safety_path = None
+    if safety_backup and os.path.exists(db_path):
+        safety_path = create_backup(db_path, backup_dir, label="before_restore")
+
+    fd, snapshot_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(db_path)))
+    os.close(fd)
+    try:
+        opener = gzip.open if backup_path.endswith(".gz") else open
+        with opener(backup_path, 'rb') as src, open(snapshot_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+        source = sqlite3.connect(snapshot_path)
+        target = _connect(db_path)
+        try:
+            _check_integrity(source)
+            # One step: the target is locked for the whole copy, so nobody sees a half-restored file
+            _copy_database(source, target, pages=-1, sleep=0)
+        finally:
+            target.close()
+            source.close()
+    finally:
+        os.remove(snapshot_path)
+
+    return safety_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Online backups of knowledge_base.db.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--dir", default=BACKUP_DIR, help="Backup directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    create = sub.add_parser("create", help="Take a backup (then apply retention)")
+    create.add_argument("--label", default="manual")
+    create.add_argument("--no-prune", action="store_true")
+
+    sub.add_parser("list", help="List backups")
+
+    prune = sub.add_parser("prune", help="Apply the retention policy")
+    prune.add_argument("--keep-last", type=int, default=KEEP_LAST)
+    prune.add_argument("--keep-daily", type=int, default=KEEP_DAILY)
+
+    restore = sub.add_parser("restore", help="Restore a backup file")
+    restore.add_argument("path")
+
+    args = parser.parse_args()
+
+    if args.command == "create":
+        started = time.monotonic()
+        path = create_backup(args.db, args.dir, args.label)
+        print(f"✅ Backup written to {path} ({os.path.getsize(path) / 1024:.0f} KiB, "
+              f"{time.monotonic() - started:.1f}s)")
+        if not args.no_prune:
+            for removed in apply_retention(args.dir):
+                print(f"🗑️  Removed old backup {removed}")
+    elif args.command == "list":
+        for backup in list_backups(args.dir):
+            print(f"{backup['created']}  {backup['size'] / 1024:>8.0f} KiB  {backup['label']:<16} {backup['path']}")
+    elif args.command == "prune":
+        removed = apply_retention(args.dir, args.keep_last, args.keep_daily)
+        print(f"Removed {len(removed)} backups")
+    elif args.command == "restore":
+        safety_path = restore_backup(args.path, args.db, args.dir)
+        print(f"✅ Restored {args.path}")
+        if safety_path:
+            print(f"   Previous database saved to {safety_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+測試 get_due_reviews 在大量資料下的效能
+
+此腳本會：
+1. 在暫存資料夾建立一個含有大量 user_progress 的測試資料庫
+2. 顯示 get_due_reviews 實際使用之查詢的 EXPLAIN QUERY PLAN，
+   若需要額外排序 (USE TEMP B-TREE) 則視為失敗
+3. 重複執行 get_due_reviews 並統計耗時
+
+Usage:
+    python benchmark_due_query.py --rows 100000 --runs 50
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from database_manager import DUE_REVIEWS_SQL, NEW_ITEMS_SQL, DatabaseManager
+
+
+def build_database(db_path, rows, due_ratio):
+    """Fill a fresh database with `rows` grammar points + progress rows."""
+    db = DatabaseManager(db_path)
+    with db.connection() as conn:
+        levels = ['N5', 'N4', 'N3', 'N2', 'N1']
+        now = datetime.now()
+
+        conn.executemany('''
+            INSERT INTO grammar_points (jlpt_level, grammar_concept, meaning, structure, explanation, tags)
+            VALUES (?, ?, '', '', '', '[]')
+        ''', ((random.choice(levels), f"concept-{i}") for i in range(rows)))
+
+        def progress_rows():
+            for grammar_id in range(1, rows + 1):
+                roll = random.random()
+                if roll < due_ratio:
+                    due = now - timedelta(days=random.randint(0, 30))
+                    yield (grammar_id, due, 'active')
+                elif roll < 0.9:
+                    due = now + timedelta(days=random.randint(1, 365))
+                    yield (grammar_id, due, 'active')
+                else:
+                    yield (grammar_id, None, 'new')
+
+        conn.executemany('''
+            INSERT INTO user_progress (grammar_id, next_review_due, status)
+            VALUES (?, ?, ?)
+        ''', progress_rows())
+        conn.commit()
+        conn.execute('ANALYZE')
+        return db
+
+
+def show_query_plan(db):
+    """
+    Print the plans of the exact queries get_due_reviews runs.
+
+    Returns:
+        list: names of queries whose plan sorts in a temp B-tree (should be empty)
+    """
+    tomorrow = (datetime.now().date() + timedelta(days=1)).isoformat()
+    queries = [
+        ("due reviews", DUE_REVIEWS_SQL.format(level_filter=""), (tomorrow, 10)),
+        ("due reviews, one level", DUE_REVIEWS_SQL.format(level_filter="AND u.level_rank = ?"), (tomorrow, 1, 10)),
+        ("new items", NEW_ITEMS_SQL.format(level_filter=""), (10,)),
+        ("new items, one level", NEW_ITEMS_SQL.format(level_filter="AND u.level_rank = ?"), (1, 10)),
+    ]
+    sorting = []
+    with db.connection() as conn:
+        for name, sql, params in queries:
+            plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+            print(f"Query plan ({name}):")
+            for detail in plan:
+                print(f"  {detail}")
+            if any("USE TEMP B-TREE" in detail for detail in plan):
+                sorting.append(name)
+    return sorting
+
+
+def run_benchmark(rows, runs, due_ratio):
+    tmp_dir = tempfile.mkdtemp(prefix="due_bench_")
+    try:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        print(f"Building {rows:,} progress rows ({due_ratio:.0%} due)...")
+        start = time.perf_counter()
+        db = build_database(db_path, rows, due_ratio)
+        print(f"  built in {time.perf_counter() - start:.1f}s\n")
+
+        sorting = show_query_plan(db)
+
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            db.get_due_reviews()
+            timings.append(time.perf_counter() - start)
+
+        timings.sort()
+        print(f"\nget_due_reviews x{runs}:")
+        print(f"  median: {timings[len(timings) // 2] * 1000:.2f} ms")
+        print(f"  p95:    {timings[int(len(timings) * 0.95) - 1] * 1000:.2f} ms")
+        print(f"  max:    {timings[-1] * 1000:.2f} ms")
+        db.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if sorting:
+        print(f"\n❌ Sorted in a temp B-tree (index does not match ORDER BY): {', '.join(sorting)}")
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the due-review query.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--due-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+    if not run_benchmark(args.rows, args.runs, args.due_ratio):
+        sys.exit(1)
@@ -1,160 +1,310 @@
 import sqlite3
 import json
-from datetime import datetime
+import queue
+import threading
+import atexit
+import hashlib
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import os
 
+import migrations
+from migrations import LEVEL_RANKS, UNKNOWN_LEVEL_RANK
+
 DB_PATH = os.path.join(os.path.dirname(__file__), "knowledge_base.db")
 
+# Connection tuning
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")  # NORMAL is durable enough under WAL
+STATEMENT_CACHE_SIZE = 256
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))  # connections shared by all threads
+
+# Review queue queries used by get_due_reviews ({level_filter} is "" or
+# "AND u.level_rank = ?"); benchmark_due_query.py checks their plans
+REVIEW_COLUMNS = '''
+    g.id, g.grammar_concept, g.meaning, g.structure, g.explanation, g.jlpt_level,
+    u.id as progress_id, u.interval, u.efactor, u.repetition_streak,
+    u.next_review_due, u.stability, u.difficulty
+'''
+
+DUE_REVIEWS_SQL = f'''
+    SELECT {REVIEW_COLUMNS}
+    FROM user_progress u
+    JOIN grammar_points g ON g.id = u.grammar_id
+    WHERE u.status = 'active' AND u.next_review_due < ? {{level_filter}}
+    ORDER BY u.level_rank, u.next_review_due
+    LIMIT ?
+'''
+
+# Walks idx_user_progress_status_level in order, stops after LIMIT rows
+NEW_ITEMS_SQL = f'''
+    SELECT {REVIEW_COLUMNS}
+    FROM user_progress u
+    JOIN grammar_points g ON g.id = u.grammar_id
+    WHERE u.status = 'new' {{level_filter}}
+    ORDER BY u.level_rank, u.grammar_id
+    LIMIT ?
+'''
+
+def level_rank(level):
+    """Integer rank for a JLPT level label (see LEVEL_RANKS)."""
+    return LEVEL_RANKS.get(level, UNKNOWN_LEVEL_RANK)
+
 class DatabaseManager:
-    def __init__(self, db_path=DB_PATH):
+    def __init__(self, db_path=DB_PATH, busy_timeout_ms=BUSY_TIMEOUT_MS, synchronous=SYNCHRONOUS,
+                 pool_size=POOL_SIZE):
         self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.synchronous = synchronous
+
+        # Bounded pool of long-lived connections, checked out per call. Not
+        # thread-local: Streamlit runs every rerun on a fresh script thread.
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()  # idle connections, most recently used first
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()  # connection held by the current thread, if any
+        atexit.register(self.close)
+
         self.init_db()
 
     def get_connection(self):
-        return sqlite3.connect(self.db_path, check_same_thread=False)
+        """Opens a new tuned connection owned by the caller (who must close it)."""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        return conn
 
-    def init_db(self):
-        """Initialize the database tables."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    @contextmanager
+    def connection(self):
+        """
+        Checks out a pooled connection for the duration of a `with` block
+        (do NOT close it):
 
-        # Table: Grammar Points (The Content)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS grammar_points (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                jlpt_level TEXT NOT NULL,
-                grammar_concept TEXT NOT NULL,
-                meaning TEXT,
-                structure TEXT,
-                explanation TEXT,
-                tags TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(jlpt_level, grammar_concept)
-            )
-        ''')
+            with db.connection() as conn:
+                ...
 
-        # Table: User Progress (The State)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_progress (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                grammar_id INTEGER NOT NULL,
-                next_review_due TIMESTAMP,
-                interval INTEGER DEFAULT 0,
-                efactor REAL DEFAULT 2.5,
-                repetition_streak INTEGER DEFAULT 0,
-                status TEXT DEFAULT 'new',
-                FOREIGN KEY (grammar_id) REFERENCES grammar_points(id)
-            )
-        ''')
+        The connection and its prepared-statement cache go back to the pool
+        afterwards, with any unfinished transaction rolled back. Nested
+        checkouts on the same thread share one connection.
+        """
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
 
-        # Table: Logs (The History)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS review_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                grammar_id INTEGER NOT NULL,
-                quality_rating INTEGER NOT NULL,
-                review_type TEXT,
-                reviewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (grammar_id) REFERENCES grammar_points(id)
-            )
-        ''')
+        conn = self._checkout()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            self._pool.put(conn)
+
+    def _checkout(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._opened < self.pool_size
+            if can_open:
+                self._opened += 1
+        if can_open:
+            try:
+                return self.get_connection()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+
+        try:
+            return self._pool.get(timeout=self.busy_timeout_ms / 1000)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"Connection pool exhausted ({self.pool_size} connections in use)")
+
+    def close(self):
+        """Close every idle pooled connection (safe to call more than once)."""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            with self._lock:
+                self._opened -= 1
+
+    def init_db(self):
+        """Create the schema, or upgrade an existing database in place (see migrations.py)."""
+        with self.connection() as conn:
+            migrations.migrate(conn)
+
+    def rebuild_due_counts(self):
+        """Recompute the per-day due counts from user_progress."""
+        with self.connection() as conn, conn:
+            migrations.rebuild_due_counts(conn.cursor())
 
-        conn.commit()
-        conn.close()
+    def get_due_counts(self, start_date, end_date):
+        """
+        Reviews due per day between two dates (inclusive).
+
+        Returns:
+            dict: {'YYYY-MM-DD': count} (days without reviews are omitted)
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT day, count FROM due_counts
+                WHERE day BETWEEN ? AND ? AND count > 0
+            ''', (str(start_date), str(end_date)))
+            return dict(cursor.fetchall())
 
     def add_grammar_point(self, level, concept, meaning, structure, explanation, tags):
         """Add a grammar point and initialize its progress."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR IGNORE INTO grammar_points (jlpt_level, grammar_concept, meaning, structure, explanation, tags)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (level, concept, meaning, structure, explanation, json.dumps(tags)))
+        with self.connection() as conn:
+            cursor = conn.cursor()
         
-        grammar_id = cursor.lastrowid
-        if grammar_id:
             cursor.execute('''
-                INSERT OR IGNORE INTO user_progress (grammar_id, status)
-                VALUES (?, 'new')
-            ''', (grammar_id,))
+                INSERT OR IGNORE INTO grammar_points (jlpt_level, grammar_concept, meaning, structure, explanation, tags)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (level, concept, meaning, structure, explanation, json.dumps(tags)))
         
-        conn.commit()
-        conn.close()
-        return grammar_id
-
-    def seed_grammar_points(self, grammar_data_list):
-        """Bulk insert grammar points from JSON data."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        inserted_count = 0
-        for item in grammar_data_list:
-            try:
+            grammar_id = cursor.lastrowid
+            if grammar_id:
                 cursor.execute('''
-                    INSERT OR IGNORE INTO grammar_points (jlpt_level, grammar_concept, meaning, structure, explanation, tags)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    item.get('jlpt_level', 'N/A'),
-                    item['grammar_concept'],
-                    item.get('meaning', ''),
-                    item.get('structure', ''),
-                    item.get('explanation', ''),
-                    json.dumps(item.get('tags', []))
-                ))
-                
-                grammar_id = cursor.lastrowid
-                if grammar_id:
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO user_progress (grammar_id, status)
-                        VALUES (?, 'new')
-                    ''', (grammar_id,))
-                    inserted_count += 1
-            except Exception as e:
-                print(f"Error inserting {item.get('grammar_concept')}: {e}")
-                continue
-        
-        conn.commit()
-        conn.close()
-        return inserted_count
-
-    def get_due_reviews(self, limit=10):
-        """Get due reviews + new items, sorted by level (N5-N1)."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+                    INSERT OR IGNORE INTO user_progress (grammar_id, status)
+                    VALUES (?, 'new')
+                ''', (grammar_id,))
         
-        today = datetime.now().date()
-        
-        # Due reviews
+            conn.commit()
+            return grammar_id
+
+    @staticmethod
+    def _seed_row(item):
+        """Grammar point row from a seed item ('level'/'concept' or 'jlpt_level'/'grammar_concept' keys)."""
+        return (
+            item.get('jlpt_level') or item.get('level') or 'N/A',
+            item.get('grammar_concept') or item['concept'],
+            item.get('meaning', ''),
+            item.get('structure', ''),
+            item.get('explanation', ''),
+            json.dumps(item.get('tags', []))
+        )
+
+    def _seed_rows(self, cursor, grammar_data_list):
+        """Upsert grammar points and add 'new' progress for inserted ones (caller owns the transaction)."""
+        cursor.execute('SELECT COALESCE(MAX(id), 0), COUNT(*) FROM grammar_points')
+        max_id, count_before = cursor.fetchone()
+
+        cursor.executemany('''
+            INSERT INTO grammar_points (jlpt_level, grammar_concept, meaning, structure, explanation, tags)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(jlpt_level, grammar_concept) DO UPDATE SET
+                meaning = excluded.meaning, structure = excluded.structure,
+                explanation = excluded.explanation, tags = excluded.tags
+            WHERE meaning IS NOT excluded.meaning OR structure IS NOT excluded.structure
+               OR explanation IS NOT excluded.explanation OR tags IS NOT excluded.tags
+        ''', [self._seed_row(item) for item in grammar_data_list])
+
         cursor.execute('''
-            SELECT g.id, g.grammar_concept, g.meaning, g.structure, g.explanation, g.jlpt_level,
-                   u.id as progress_id, u.interval, u.efactor, u.repetition_streak
-            FROM grammar_points g
-            JOIN user_progress u ON g.id = u.grammar_id
-            WHERE u.status = 'active' AND date(u.next_review_due) <= date(?)
-            ORDER BY g.jlpt_level DESC
-            LIMIT ?
-        ''', (today, limit))
-        due_items = cursor.fetchall()
+            INSERT INTO user_progress (grammar_id, status)
+            SELECT g.id, 'new' FROM grammar_points g
+            WHERE g.id > ?
+              AND NOT EXISTS (SELECT 1 FROM user_progress u WHERE u.grammar_id = g.id)
+        ''', (max_id,))
+
+        cursor.execute('SELECT COUNT(*) FROM grammar_points')
+        return cursor.fetchone()[0] - count_before
+
+    def seed_grammar_points(self, grammar_data_list):
+        """
+        Bulk insert grammar points from JSON data in a single transaction.
+        Existing points get their content refreshed.
+
+        Returns:
+            int: Number of new grammar points.
+        """
+        with self.connection() as conn, conn:
+            return self._seed_rows(conn.cursor(), grammar_data_list)
+
+    def seed_from_files(self, paths):
+        """
+        Load seed JSON files in one transaction, skipping files whose content
+        hash matches the last load (so a warm start reads no JSON at all).
+
+        Returns:
+            dict: {filename: new grammar points} for the files that were loaded
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT filename, sha256 FROM seed_files')
+            known = dict(cursor.fetchall())
+
+            pending = []
+            for path in paths:
+                if not os.path.exists(path):
+                    continue
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                digest = hashlib.sha256(raw).hexdigest()
+                filename = os.path.basename(path)
+                if known.get(filename) != digest:
+                    pending.append((filename, digest, json.loads(raw.decode('utf-8'))))
+
+            loaded = {}
+            if pending:
+                with conn:
+                    for filename, digest, items in pending:
+                        loaded[filename] = self._seed_rows(cursor, items)
+                        cursor.execute('''
+                            INSERT INTO seed_files (filename, sha256, items, loaded_at)
+                            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                            ON CONFLICT(filename) DO UPDATE SET
+                                sha256 = excluded.sha256, items = excluded.items, loaded_at = excluded.loaded_at
+                        ''', (filename, digest, len(items)))
+            return loaded
+
+    def get_due_reviews(self, limit=10, level=None, new_limit=10):
+        """
+        Get due reviews + new items, easiest level first (N5 -> N1).
+
+        Args:
+            limit (int): Maximum number of due reviews.
+            level (str): Only return items of this JLPT level (e.g. 'N3').
+            new_limit (int): Maximum number of new items.
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
         
-        # New items
-        cursor.execute('''
-            SELECT g.id, g.grammar_concept, g.meaning, g.structure, g.explanation, g.jlpt_level,
-                   u.id as progress_id, u.interval, u.efactor, u.repetition_streak
-            FROM grammar_points g
-            JOIN user_progress u ON g.id = u.grammar_id
-            WHERE u.status = 'new'
-            ORDER BY g.jlpt_level DESC
-            LIMIT 10
-        ''')
-        new_items = cursor.fetchall()
+            # Due = anything before the start of tomorrow. Comparing the raw column
+            # (instead of date(next_review_due)) keeps the status/due index usable.
+            tomorrow = (datetime.now().date() + timedelta(days=1)).isoformat()
+            level_filter = "AND u.level_rank = ?" if level else ""
+            level_params = (level_rank(level),) if level else ()
+        
+            cursor.execute(DUE_REVIEWS_SQL.format(level_filter=level_filter), (tomorrow, *level_params, limit))
+            due_items = cursor.fetchall()
         
-        conn.close()
+            cursor.execute(NEW_ITEMS_SQL.format(level_filter=level_filter), (*level_params, new_limit))
+            new_items = cursor.fetchall()
         
-        return {
-            "reviews": self._format_results(due_items),
-            "new": self._format_results(new_items)
-        }
+            return {
+                "reviews": self._format_results(due_items),
+                "new": self._format_results(new_items)
+            }
 
     def _format_results(self, rows):
         """Format database rows into dictionaries."""
@@ -170,157 +320,328 @@ class DatabaseManager:
                 "progress_id": row[6],
                 "interval": row[7],
                 "efactor": row[8],
-                "repetition": row[9]
+                "repetition": row[9],
+                "next_review_due": row[10],
+                "stability": row[11],
+                "difficulty": row[12]
             })
         return results
 
-    def update_progress(self, progress_id, grammar_id, quality, interval, efactor, repetition, next_date):
-        """Update user progress after review."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def update_progress(self, progress_id, grammar_id, quality, interval, efactor, repetition, next_date,
+                        stability=None, difficulty=None):
+        """Update user progress after review (stability/difficulty only for FSRS)."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            UPDATE user_progress
-            SET interval = ?, efactor = ?, repetition_streak = ?, 
-                next_review_due = ?, status = 'active'
-            WHERE id = ?
-        ''', (interval, efactor, repetition, next_date, progress_id))
+            cursor.execute('''
+                UPDATE user_progress
+                SET interval = ?, efactor = ?, repetition_streak = ?, 
+                    next_review_due = ?, status = 'active',
+                    stability = ?, difficulty = ?
+                WHERE id = ?
+            ''', (interval, efactor, repetition, next_date, stability, difficulty, progress_id))
         
-        cursor.execute('''
-            INSERT INTO review_logs (grammar_id, quality_rating, review_type)
-            VALUES (?, ?, ?)
-        ''', (grammar_id, quality, 'review' if repetition > 1 else 'learn'))
+            cursor.execute('''
+                INSERT INTO review_logs (grammar_id, quality_rating, review_type, event_id)
+                VALUES (?, ?, ?, ?)
+            ''', (grammar_id, quality, 'review' if repetition > 1 else 'learn', uuid.uuid4().hex))
         
-        conn.commit()
-        conn.close()
+            conn.commit()
+
+    def apply_review_updates(self, updates):
+        """
+        Apply a batch of buffered reviews in a single transaction.
+
+        Each update is a dict with event_id, progress_id, grammar_id, quality,
+        interval, efactor, repetition, next_review_due and reviewed_at
+        (plus optional FSRS stability/difficulty).
+        Idempotent: events whose event_id is already logged are skipped, so a
+        journal can be replayed safely after a crash.
+        """
+        if not updates:
+            return 0
+
+        with self.connection() as conn, conn:
+            # Progress first (guarded by the log row), then the logs themselves
+            conn.executemany('''
+                UPDATE user_progress
+                SET interval = ?, efactor = ?, repetition_streak = ?,
+                    next_review_due = ?, status = 'active',
+                    stability = ?, difficulty = ?
+                WHERE id = ?
+                  AND NOT EXISTS (SELECT 1 FROM review_logs WHERE event_id = ?)
+            ''', [
+                (u['interval'], u['efactor'], u['repetition'], u['next_review_due'],
+                 u.get('stability'), u.get('difficulty'), u['progress_id'], u['event_id'])
+                for u in updates
+            ])
+            cursor = conn.executemany('''
+                INSERT OR IGNORE INTO review_logs (grammar_id, quality_rating, review_type, reviewed_at, event_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [
+                (u['grammar_id'], u['quality'], 'review' if u['repetition'] > 1 else 'learn',
+                 u['reviewed_at'], u['event_id'])
+                for u in updates
+            ])
+            return cursor.rowcount
 
     def get_stats(self):
         """Get user learning statistics."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT 
-                COUNT(*) FILTER (WHERE status = 'new') as new_count,
-                COUNT(*) FILTER (WHERE status = 'active') as active_count,
-                AVG(repetition_streak) FILTER (WHERE status = 'active') as avg_streak
-            FROM user_progress
-        ''')
-        stats = cursor.fetchone()
-        
-        cursor.execute('''
-            SELECT COUNT(*) as total_reviews,
-                   AVG(quality_rating) as avg_quality
-            FROM review_logs
-            LIMIT 100
-        ''')
-        recent_stats = cursor.fetchone()
-        
-        conn.close()
+            cursor.execute('''
+                SELECT 
+                    COUNT(*) FILTER (WHERE status = 'new') as new_count,
+                    COUNT(*) FILTER (WHERE status = 'active') as active_count,
+                    AVG(repetition_streak) FILTER (WHERE status = 'active') as avg_streak
+                FROM user_progress
+            ''')
+            stats = cursor.fetchone()
         
-        return {
-            "new": stats[0] or 0,
-            "active": stats[1] or 0,
-            "avg_streak": round(stats[2] or 0, 1),
-            "recent_reviews": recent_stats[0] or 0,
-            "avg_quality": round(recent_stats[1] or 0, 1)
-        }
+            cursor.execute('''
+                SELECT COUNT(*) as total_reviews,
+                       AVG(quality_rating) as avg_quality
+                FROM review_logs
+                LIMIT 100
+            ''')
+            recent_stats = cursor.fetchone()
+
+            return {
+                "new": stats[0] or 0,
+                "active": stats[1] or 0,
+                "avg_streak": round(stats[2] or 0, 1),
+                "recent_reviews": recent_stats[0] or 0,
+                "avg_quality": round(recent_stats[1] or 0, 1)
+            }
 
     def export_progress(self):
         """Export user progress and grammar points to JSON format."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.connection() as conn:
+            cursor = conn.cursor()
         
-        # Get all progress with grammar details
-        cursor.execute('''
-            SELECT g.grammar_concept, g.jlpt_level, g.meaning, g.structure, g.explanation,
-                   u.status, u.interval, u.efactor, u.repetition_streak, u.next_review_due
-            FROM grammar_points g
-            JOIN user_progress u ON g.id = u.grammar_id
-            WHERE u.status != 'new'
-        ''')
-        
-        progress_data = []
-        for row in cursor.fetchall():
-            progress_data.append({
-                "grammar_concept": row[0],
-                "jlpt_level": row[1],
-                "meaning": row[2],
-                "structure": row[3],
-                "explanation": row[4],
-                "status": row[5],
-                "interval": row[6],
-                "efactor": row[7],
-                "repetition_streak": row[8],
-                "next_review_due": row[9]
-            })
-        
-        conn.close()
+            # Get all progress with grammar details
+            cursor.execute('''
+                SELECT g.grammar_concept, g.jlpt_level, g.meaning, g.structure, g.explanation,
+                       u.status, u.interval, u.efactor, u.repetition_streak, u.next_review_due
+                FROM grammar_points g
+                JOIN user_progress u ON g.id = u.grammar_id
+                WHERE u.status != 'new'
+            ''')
         
-        export_data = {
-            "export_date": datetime.now().isoformat(),
-            "total_items": len(progress_data),
-            "progress": progress_data
-        }
+            progress_data = []
+            for row in cursor.fetchall():
+                progress_data.append({
+                    "grammar_concept": row[0],
+                    "jlpt_level": row[1],
+                    "meaning": row[2],
+                    "structure": row[3],
+                    "explanation": row[4],
+                    "status": row[5],
+                    "interval": row[6],
+                    "efactor": row[7],
+                    "repetition_streak": row[8],
+                    "next_review_due": row[9]
+                })
+
+            export_data = {
+                "export_date": datetime.now().isoformat(),
+                "total_items": len(progress_data),
+                "progress": progress_data
+            }
         
-        return export_data
+            return export_data
 
     def import_progress(self, import_data):
         """Import progress data from JSON format."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.connection() as conn:
+            cursor = conn.cursor()
         
-        added = 0
-        updated = 0
-        skipped = 0
+            added = 0
+            updated = 0
+            skipped = 0
         
-        for item in import_data.get('progress', []):
-            try:
-                # Find grammar point
-                cursor.execute('SELECT id FROM grammar_points WHERE grammar_concept = ? AND jlpt_level = ?', 
-                             (item['grammar_concept'], item['jlpt_level']))
-                result = cursor.fetchone()
+            for item in import_data.get('progress', []):
+                try:
+                    # Find grammar point
+                    cursor.execute('SELECT id FROM grammar_points WHERE grammar_concept = ? AND jlpt_level = ?', 
+                                 (item['grammar_concept'], item['jlpt_level']))
+                    result = cursor.fetchone()
                 
-                if not result:
-                    skipped += 1
-                    continue
+                    if not result:
+                        skipped += 1
+                        continue
                 
-                grammar_id = result[0]
+                    grammar_id = result[0]
                 
-                # Check if progress exists
-                cursor.execute('SELECT id FROM user_progress WHERE grammar_id = ?', (grammar_id,))
-                progress = cursor.fetchone()
+                    # Check if progress exists
+                    cursor.execute('SELECT id FROM user_progress WHERE grammar_id = ?', (grammar_id,))
+                    progress = cursor.fetchone()
                 
-                if progress:
-                    # Update existing
-                    cursor.execute('''
-                        UPDATE user_progress
-                        SET status = ?, interval = ?, efactor = ?, 
-                            repetition_streak = ?, next_review_due = ?
-                        WHERE grammar_id = ?
-                    ''', (item['status'], item['interval'], item['efactor'], 
-                          item['repetition_streak'], item['next_review_due'], grammar_id))
-                    updated += 1
-                else:
-                    # Insert new
-                    cursor.execute('''
-                        INSERT INTO user_progress (grammar_id, status, interval, efactor, 
-                                                   repetition_streak, next_review_due)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (grammar_id, item['status'], item['interval'], item['efactor'],
-                          item['repetition_streak'], item['next_review_due']))
-                    added += 1
+                    if progress:
+                        # Update existing
+                        cursor.execute('''
+                            UPDATE user_progress
+                            SET status = ?, interval = ?, efactor = ?, 
+                                repetition_streak = ?, next_review_due = ?
+                            WHERE grammar_id = ?
+                        ''', (item['status'], item['interval'], item['efactor'], 
+                              item['repetition_streak'], item['next_review_due'], grammar_id))
+                        updated += 1
+                    else:
+                        # Insert new
+                        cursor.execute('''
+                            INSERT INTO user_progress (grammar_id, status, interval, efactor, 
+                                                       repetition_streak, next_review_due)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                        ''', (grammar_id, item['status'], item['interval'], item['efactor'],
+                              item['repetition_streak'], item['next_review_due']))
+                        added += 1
                     
-            except Exception as e:
-                print(f"Error importing {item.get('grammar_concept')}: {e}")
-                skipped += 1
-                continue
+                except Exception as e:
+                    print(f"Error importing {item.get('grammar_concept')}: {e}")
+                    skipped += 1
+                    continue
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         
-        return {
-            "added": added,
-            "updated": updated,
-            "skipped": skipped
-        }
+            return {
+                "added": added,
+                "updated": updated,
+                "skipped": skipped
+            }
+
+    # --- Exercise Bank ---
+
+    def count_exercises(self, grammar_id):
+        """Number of banked exercises for a grammar point."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM exercise_bank WHERE grammar_id = ?', (grammar_id,))
+            count = cursor.fetchone()[0]
+            return count
+
+    def add_exercise(self, grammar_id, content, max_per_point=20, shown=False):
+        """
+        Store a generated exercise and enforce the per-point size cap.
+
+        Args:
+            grammar_id (int): grammar_points.id the exercise belongs to.
+            content (dict): AITutor lesson content (question/context/hint/example_sentence).
+            max_per_point (int): Bank size cap; the most-used exercises are evicted first.
+            shown (bool): Mark the exercise as shown now (it is being served right away).
+
+        Returns:
+            int: The new exercise id.
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                INSERT INTO exercise_bank (grammar_id, question, context, hint, example_sentence,
+                                           audio_key, times_shown, last_shown_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                grammar_id,
+                content.get('question', ''),
+                content.get('context'),
+                content.get('hint'),
+                content.get('example_sentence'),
+                content.get('audio_key'),
+                1 if shown else 0,
+                datetime.now() if shown else None
+            ))
+            exercise_id = cursor.lastrowid
+
+            # The new exercise is never its own eviction victim
+            self._evict_exercises(cursor, grammar_id, max_per_point, protect_id=exercise_id)
+
+            conn.commit()
+            return exercise_id
+
+    def _evict_exercises(self, cursor, grammar_id, keep, protect_id=None):
+        """
+        Drop the most-shown (then oldest) exercises beyond `keep`.
+        `protect_id` is always kept and counts towards `keep`.
+        """
+        if protect_id is not None:
+            keep -= 1
+        cursor.execute('''
+            DELETE FROM exercise_bank
+            WHERE id IN (
+                SELECT id FROM exercise_bank
+                WHERE grammar_id = ? AND id IS NOT ?
+                ORDER BY times_shown ASC, created_at DESC, id DESC
+                LIMIT -1 OFFSET ?
+            )
+        ''', (grammar_id, protect_id, max(keep, 0)))
+        return cursor.rowcount
+
+    def evict_exercises(self, grammar_id, keep):
+        """Trim a grammar point's bank down to `keep` exercises."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            removed = self._evict_exercises(cursor, grammar_id, keep)
+            conn.commit()
+            return removed
+
+    def next_exercise(self, grammar_id):
+        """
+        Serve the least-recently-shown exercise for a grammar point and mark it shown.
+
+        Returns:
+            dict or None: Exercise content, including 'exercise_id' and 'audio_key'.
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            # Never-shown exercises (NULL) sort first
+            cursor.execute('''
+                SELECT id, question, context, hint, example_sentence, audio_key
+                FROM exercise_bank
+                WHERE grammar_id = ?
+                ORDER BY last_shown_at ASC, id ASC
+                LIMIT 1
+            ''', (grammar_id,))
+            row = cursor.fetchone()
+
+            if not row:
+                return None
+
+            cursor.execute('''
+                UPDATE exercise_bank
+                SET times_shown = times_shown + 1, last_shown_at = ?
+                WHERE id = ?
+            ''', (datetime.now(), row[0]))
+
+            conn.commit()
+
+            return {
+                "exercise_id": row[0],
+                "question": row[1],
+                "context": row[2],
+                "hint": row[3],
+                "example_sentence": row[4],
+                "audio_key": row[5]
+            }
+
+    def get_exercise_audio(self, grammar_id):
+        """Banked exercises of a grammar point with their recorded audio keys (None: never voiced)."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, question, example_sentence, audio_key FROM exercise_bank
+                WHERE grammar_id = ?
+            ''', (grammar_id,))
+            return [
+                {"exercise_id": row[0], "question": row[1], "example_sentence": row[2] or row[1],
+                 "audio_key": row[3]}
+                for row in cursor.fetchall()
+            ]
+
+    def set_exercise_audio(self, exercise_id, audio_key):
+        """Record the audio cache key rendered for an exercise."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('UPDATE exercise_bank SET audio_key = ? WHERE id = ?', (audio_key, exercise_id))
+            conn.commit()
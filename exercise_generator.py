@@ -0,0 +1,206 @@
+"""
+離線批次生成練習題 (Exercise Bank 預熱)
+
+此腳本會：
+1. 逐一讀取 grammar_points 中的每個文法點
+2. 為每個文法點預先生成 N 題練習 + TTS 語音，存入 exercise_bank
+3. 以多執行緒並行發送請求，並受速率限制 (requests/min) 控制
+4. 將進度寫入 checkpoint 檔，中斷後重新執行會從上次停下的地方繼續
+   (語音生成失敗的題目不會被標記完成，下次執行時會重新生成語音)
+
+Usage:
+    python exercise_generator.py --per-point 5 --workers 8 --rpm 60
+    python exercise_generator.py --levels N4 N3 --per-point 3
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+import ai_tutor
+import lesson_pipeline
+from ai_tutor import AITutor
+from database_manager import DatabaseManager
+
+load_dotenv()
+
+CHECKPOINT_PATH = os.path.join(os.path.dirname(__file__), "exercise_generator_checkpoint.json")
+
+
+class RateLimiter:
+    """Spaces out calls so that at most `per_minute` start in any minute (thread-safe)."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Checkpoint:
+    """Set of finished grammar ids persisted to disk after every point."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.done = set(json.load(f).get('done', []))
+
+    def mark_done(self, grammar_id):
+        with self._lock:
+            self.done.add(grammar_id)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"done": sorted(self.done), "updated_at": time.strftime('%Y-%m-%d %H:%M:%S')}, f)
+            os.replace(tmp_path, self.path)  # Atomic: a killed run never leaves a torn checkpoint
+
+
+def fetch_grammar_points(db, levels=None):
+    """All grammar points as card-like dicts, optionally filtered by level."""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, grammar_concept, meaning, jlpt_level FROM grammar_points ORDER BY id')
+        rows = cursor.fetchall()
+
+        points = [
+            {"grammar_id": row[0], "grammar_concept": row[1], "meaning": row[2], "level": row[3]}
+            for row in rows
+        ]
+        if levels:
+            points = [p for p in points if p['level'] in levels]
+        return points
+
+
+def generate_one(tutor, db, point, limiter):
+    """Generate, store and voice one exercise. Returns True on success."""
+    limiter.acquire()
+    content = tutor.generate_lesson_content(point)
+    if not content.get('example_sentence'):
+        print(f"  ⚠️ 生成失敗: {point['grammar_concept']} ({content.get('question', '')[:40]})")
+        return False
+
+    content['exercise_id'] = db.add_exercise(point['grammar_id'], content, max_per_point=ai_tutor.BANK_MAX_SIZE)
+    return voice_one(db, point, content)
+
+
+def voice_one(db, point, exercise):
+    """
+    Render a banked exercise's audio. Returns True on success.
+
+    The audio key is only recorded once the clip exists, so a failed or killed
+    render is voiced again on the next run.
+    """
+    lesson_pipeline.build_audio(exercise, db)
+    if not exercise.get('audio_path'):
+        print(f"  ⚠️ 語音生成失敗: {point['grammar_concept']}")
+        return False
+    return True
+
+
+def run(per_point, workers, rpm, levels=None, checkpoint_path=CHECKPOINT_PATH, reset=False):
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        print("Error: No API Key found.")
+        return
+
+    tutor = AITutor(api_key=api_key)
+    if not tutor.model:
+        print("Error: No generation model available.")
+        return
+
+    if per_point > ai_tutor.BANK_MAX_SIZE:
+        print(f"⚠️ per-point 超過題庫上限，改為 {ai_tutor.BANK_MAX_SIZE}")
+        per_point = ai_tutor.BANK_MAX_SIZE
+
+    db = DatabaseManager()
+    if reset and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = Checkpoint(checkpoint_path)
+    limiter = RateLimiter(rpm)
+
+    # Work out how many exercises each point still needs, plus banked ones still missing audio
+    jobs = []  # (point, exercise to voice or None to generate a new one)
+    remaining = {}
+    for point in fetch_grammar_points(db, levels):
+        if point['grammar_id'] in checkpoint.done:
+            continue
+        # Voiced = recorded key is current and the clip is actually in the cache
+        unvoiced = [e for e in db.get_exercise_audio(point['grammar_id']) if not lesson_pipeline.has_audio(e)]
+        missing = per_point - db.count_exercises(point['grammar_id'])
+        if missing <= 0 and not unvoiced:
+            checkpoint.mark_done(point['grammar_id'])
+            continue
+        remaining[point['grammar_id']] = max(missing, 0) + len(unvoiced)
+        jobs.extend((point, exercise) for exercise in unvoiced)
+        jobs.extend([(point, None)] * max(missing, 0))
+
+    print(f"需要生成 {len(jobs)} 題 ({len(remaining)} 個文法點)，已完成 {len(checkpoint.done)} 個文法點")
+    if not jobs:
+        return
+
+    generated = 0
+    failed = 0
+    failed_points = set()
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            (executor.submit(voice_one, db, point, exercise) if exercise
+             else executor.submit(generate_one, tutor, db, point, limiter)): point
+            for point, exercise in jobs
+        }
+        for future in as_completed(futures):
+            point = futures[future]
+            try:
+                ok = future.result()
+            except Exception as e:
+                print(f"  ❌ {point['grammar_concept']}: {e}")
+                ok = False
+
+            if ok:
+                generated += 1
+            else:
+                failed += 1
+                failed_points.add(point['grammar_id'])
+
+            # A point is checkpointed once all its jobs succeeded; failed ones are retried next run
+            remaining[point['grammar_id']] -= 1
+            if remaining[point['grammar_id']] == 0 and point['grammar_id'] not in failed_points:
+                if db.count_exercises(point['grammar_id']) >= per_point:
+                    checkpoint.mark_done(point['grammar_id'])
+
+            done = generated + failed
+            if done % 10 == 0 or done == len(jobs):
+                elapsed = time.monotonic() - started
+                print(f"[{done}/{len(jobs)}] 成功 {generated} / 失敗 {failed} ({elapsed:.0f}s)")
+
+    print(f"Done! 生成 {generated} 題，失敗 {failed} 題")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate exercises and audio for every grammar point.")
+    parser.add_argument("--per-point", type=int, default=5, help="Exercises to keep per grammar point")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent requests")
+    parser.add_argument("--rpm", type=int, default=60, help="Max LLM requests per minute")
+    parser.add_argument("--levels", nargs="*", help="Only these JLPT levels (e.g. N4 N3)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="Checkpoint file path")
+    parser.add_argument("--reset", action="store_true", help="Ignore the existing checkpoint")
+    args = parser.parse_args()
+
+    run(args.per_point, args.workers, args.rpm, args.levels, args.checkpoint, args.reset)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+FSRS-style scheduler (memory stability / difficulty model) + parameter fitting.
+
+The model follows FSRS v4: each card has a stability S (days until recall
+probability drops to 90%) and a difficulty D (1-10). Parameters can be fitted
+from the review_logs history:
+
+    python fsrs_engine.py --generations 30 --population 32 --workers 4
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+import numpy as np
+
+PARAMS_PATH = os.path.join(os.path.dirname(__file__), "fsrs_params.json")
+DESIRED_RETENTION = 0.9
+MAX_INTERVAL = 36500
+
+# FSRS v4 default weights
+DEFAULT_PARAMS = [
+    0.4, 0.6, 2.4, 5.8,        # w0-w3: initial stability for Again/Hard/Good/Easy
+    4.93, 0.94,                # w4-w5: initial difficulty
+    0.86, 0.01,                # w6-w7: difficulty update / mean reversion
+    1.49, 0.14, 0.94,          # w8-w10: stability after recall
+    2.18, 0.05, 0.34, 1.26,    # w11-w14: stability after lapse
+    0.29, 2.61                 # w15-w16: hard penalty / easy bonus
+]
+PARAM_BOUNDS = [
+    (0.1, 100), (0.1, 100), (0.1, 100), (0.1, 100),
+    (1, 10), (0.1, 5),
+    (0.1, 5), (0, 0.5),
+    (0, 3), (0, 0.8), (0.01, 2.5),
+    (0.5, 5), (0.01, 0.2), (0.01, 0.9), (0.01, 2),
+    (0, 1), (1, 4)
+]
+
+
+def quality_to_grade(quality):
+    """Maps the app's 0-5 rating to FSRS grades: 1=Again, 2=Hard, 3=Good, 4=Easy."""
+    quality = np.asarray(quality)
+    return np.select([quality <= 2, quality == 3, quality == 4], [1, 2, 3], default=4)
+
+
+class FSRSEngine:
+    """
+    Scheduler with the same schedule() interface as SRSEngine.
+
+    All model functions accept scalars or NumPy arrays, so the optimizer and the
+    live scheduler share the exact same math.
+    """
+
+    name = "fsrs"
+
+    def __init__(self, params=None, desired_retention=DESIRED_RETENTION):
+        self.w = np.asarray(params if params is not None else DEFAULT_PARAMS, dtype=np.float64)
+        self.desired_retention = desired_retention
+
+    @classmethod
+    def load(cls, path=PARAMS_PATH):
+        """Engine with fitted parameters if available, defaults otherwise."""
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return cls(data['params'], data.get('desired_retention', DESIRED_RETENTION))
+        return cls()
+
+    def save(self, path=PARAMS_PATH, **metadata):
+        data = {"params": [round(float(x), 4) for x in self.w], "desired_retention": self.desired_retention}
+        data.update(metadata)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+
+    # --- Model ---
+
+    def init_stability(self, grade):
+        return self.w[np.asarray(grade) - 1]
+
+    def init_difficulty(self, grade):
+        return np.clip(self.w[4] - (np.asarray(grade) - 3) * self.w[5], 1, 10)
+
+    @staticmethod
+    def retrievability(elapsed_days, stability):
+        return (1 + np.asarray(elapsed_days) / (9 * np.asarray(stability))) ** -1
+
+    def next_difficulty(self, difficulty, grade):
+        updated = difficulty - self.w[6] * (grade - 3)
+        # Mean reversion towards the initial difficulty of a "Good" answer
+        reverted = self.w[7] * self.w[4] + (1 - self.w[7]) * updated
+        return np.clip(reverted, 1, 10)
+
+    def recall_stability(self, difficulty, stability, retrievability, grade):
+        hard_penalty = np.where(grade == 2, self.w[15], 1.0)
+        easy_bonus = np.where(grade == 4, self.w[16], 1.0)
+        growth = (
+            np.exp(self.w[8]) * (11 - difficulty) * np.power(stability, -self.w[9])
+            * (np.exp((1 - retrievability) * self.w[10]) - 1)
+        )
+        return stability * (growth * hard_penalty * easy_bonus + 1)
+
+    def forget_stability(self, difficulty, stability, retrievability):
+        return (
+            self.w[11] * np.power(difficulty, -self.w[12])
+            * (np.power(stability + 1, self.w[13]) - 1)
+            * np.exp((1 - retrievability) * self.w[14])
+        )
+
+    def next_interval(self, stability):
+        interval = 9 * stability * (1 / self.desired_retention - 1)
+        return int(min(max(round(float(interval)), 1), MAX_INTERVAL))
+
+    # --- Scheduling ---
+
+    def calculate_review(self, quality, stability=None, difficulty=None, elapsed_days=0, repetition=0):
+        """
+        Calculate the next review from the card's memory state.
+
+        Args:
+            quality (int): User rating (0-5), see SRSEngine.calculate_review.
+            stability (float): Current stability in days (None for a first review).
+            difficulty (float): Current difficulty 1-10 (None for a first review).
+            elapsed_days (float): Days since the previous review.
+            repetition (int): Successful repetitions so far.
+
+        Returns:
+            dict: interval, repetition, stability, difficulty, next_review_date
+        """
+        grade = int(quality_to_grade(quality))
+
+        if stability is None or difficulty is None:
+            new_stability = float(self.init_stability(grade))
+            new_difficulty = float(self.init_difficulty(grade))
+        else:
+            r = self.retrievability(max(elapsed_days, 0), stability)
+            if grade == 1:
+                new_stability = float(self.forget_stability(difficulty, stability, r))
+            else:
+                new_stability = float(self.recall_stability(difficulty, stability, r, grade))
+            new_difficulty = float(self.next_difficulty(difficulty, grade))
+
+        interval = 1 if grade == 1 else self.next_interval(new_stability)
+
+        return {
+            "interval": interval,
+            "repetition": repetition + 1 if grade > 1 else 0,
+            "stability": round(new_stability, 4),
+            "difficulty": round(new_difficulty, 4),
+            "next_review_date": datetime.now() + timedelta(days=interval)
+        }
+
+    def schedule(self, card, quality, now=None):
+        """Schedule a card dict from DatabaseManager.get_due_reviews()."""
+        now = now or datetime.now()
+        elapsed_days = 0
+        due = card.get('next_review_due')
+        if due and card.get('interval'):
+            # Last review = due date - scheduled interval
+            last_review = datetime.fromisoformat(str(due)) - timedelta(days=card['interval'])
+            elapsed_days = (now - last_review).total_seconds() / 86400
+
+        result = self.calculate_review(
+            quality,
+            stability=card.get('stability'),
+            difficulty=card.get('difficulty'),
+            elapsed_days=elapsed_days,
+            repetition=card.get('repetition', 0)
+        )
+        result['efactor'] = card.get('efactor', 2.5)  # Unused by FSRS, kept as-is
+        return result
+
+
+# --- Parameter fitting ---
+
+def load_histories(db, max_reviews=64):
+    """
+    Review histories from review_logs as padded arrays (cards x reviews).
+
+    Returns:
+        (grades, elapsed, mask): FSRS grades, days since the previous review,
+        and which cells hold a real review.
+    """
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT grammar_id, quality_rating, julianday(reviewed_at)
+            FROM review_logs
+            ORDER BY grammar_id, reviewed_at, id
+        ''')
+
+        histories = []
+        current_id = None
+        current = []
+        for grammar_id, quality, day in cursor:
+            if grammar_id != current_id:
+                if len(current) > 1:
+                    histories.append(current[:max_reviews])
+                current_id = grammar_id
+                current = []
+            current.append((quality, day))
+        if len(current) > 1:
+            histories.append(current[:max_reviews])
+
+        length = max((len(h) for h in histories), default=0)
+        grades = np.ones((len(histories), length), dtype=np.int64)
+        elapsed = np.zeros((len(histories), length), dtype=np.float64)
+        mask = np.zeros((len(histories), length), dtype=bool)
+        for i, history in enumerate(histories):
+            qualities = [q for q, _ in history]
+            days = np.array([d for _, d in history])
+            n = len(history)
+            grades[i, :n] = quality_to_grade(qualities)
+            elapsed[i, 1:n] = np.diff(days)
+            mask[i, :n] = True
+        return grades, elapsed, mask
+
+
+def evaluate_loss(params, grades, elapsed, mask):
+    """Mean log-loss of predicted recall over all non-first reviews (vectorized over cards)."""
+    engine = FSRSEngine(params)
+    if grades.shape[1] < 2:
+        return float('nan')
+
+    stability = engine.init_stability(grades[:, 0])
+    difficulty = engine.init_difficulty(grades[:, 0])
+    total_loss = 0.0
+    count = 0
+
+    for step in range(1, grades.shape[1]):
+        active = mask[:, step]
+        if not active.any():
+            break
+        grade = grades[:, step]
+        r = engine.retrievability(elapsed[:, step], stability)
+        p = np.clip(r, 1e-6, 1 - 1e-6)
+        recalled = grade > 1
+        loss = -(recalled * np.log(p) + (~recalled) * np.log(1 - p))
+        total_loss += loss[active].sum()
+        count += int(active.sum())
+
+        new_stability = np.where(
+            recalled,
+            engine.recall_stability(difficulty, stability, r, grade),
+            engine.forget_stability(difficulty, stability, r)
+        )
+        new_difficulty = engine.next_difficulty(difficulty, grade)
+        stability = np.where(active, np.clip(new_stability, 0.01, MAX_INTERVAL), stability)
+        difficulty = np.where(active, new_difficulty, difficulty)
+
+    return total_loss / count if count else float('nan')
+
+
+_worker_data = None
+
+def _init_worker(grades, elapsed, mask):
+    global _worker_data
+    _worker_data = (grades, elapsed, mask)
+
+def _worker_loss(params):
+    return evaluate_loss(params, *_worker_data)
+
+
+def fit_parameters(grades, elapsed, mask, generations=30, population=32, workers=None,
+                   initial=None, seed=0):
+    """
+    Fit FSRS parameters by an evolution-strategy search.
+
+    Each generation samples `population` candidates around the best parameters
+    so far and scores them in parallel worker processes.
+
+    Returns:
+        (params, loss)
+    """
+    rng = np.random.default_rng(seed)
+    lower = np.array([b[0] for b in PARAM_BOUNDS])
+    upper = np.array([b[1] for b in PARAM_BOUNDS])
+    best = np.clip(np.asarray(initial if initial is not None else DEFAULT_PARAMS, dtype=np.float64), lower, upper)
+    best_loss = evaluate_loss(best, grades, elapsed, mask)
+    step = 0.2
+
+    with Pool(processes=workers, initializer=_init_worker, initargs=(grades, elapsed, mask)) as pool:
+        for generation in range(generations):
+            noise = rng.normal(0, step, size=(population, len(best)))
+            candidates = np.clip(best * np.exp(noise), lower, upper)
+            losses = pool.map(_worker_loss, list(candidates))
+
+            i = int(np.nanargmin(losses))
+            if losses[i] < best_loss:
+                best, best_loss = candidates[i], losses[i]
+            else:
+                step *= 0.8  # Narrow the search when nothing improved
+            print(f"Generation {generation + 1}/{generations}: loss {best_loss:.5f} (step {step:.3f})")
+
+    return best.tolist(), best_loss
+
+
+def main():
+    from database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Fit FSRS parameters from review_logs.")
+    parser.add_argument("--generations", type=int, default=30)
+    parser.add_argument("--population", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--retention", type=float, default=DESIRED_RETENTION, help="Desired retention")
+    parser.add_argument("--output", default=PARAMS_PATH)
+    args = parser.parse_args()
+
+    grades, elapsed, mask = load_histories(DatabaseManager())
+    reviews = int(mask[:, 1:].sum()) if mask.size else 0
+    print(f"Loaded {len(grades)} cards with {reviews} scored reviews")
+    if reviews == 0:
+        print("Not enough review history to fit parameters.")
+        return
+
+    start_params = FSRSEngine.load(args.output).w
+    print(f"Initial loss: {evaluate_loss(start_params, grades, elapsed, mask):.5f}")
+    params, loss = fit_parameters(
+        grades, elapsed, mask,
+        generations=args.generations, population=args.population,
+        workers=args.workers, initial=start_params
+    )
+
+    engine = FSRSEngine(params, args.retention)
+    engine.save(args.output, loss=round(float(loss), 5), reviews=reviews,
+                fitted_at=datetime.now().isoformat(timespec='seconds'))
+    print(f"Done! Saved parameters to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
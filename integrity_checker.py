@@ -0,0 +1,174 @@
+"""
+資料庫完整性檢查與修復
+
+以視窗函數 (window functions) 一次找出所有問題，並在單一交易中以少數幾個
+集合式 (set-based) SQL 修復：
+1. 重複的文法項目 (同 jlpt_level + grammar_concept)：保留最早的一筆，
+   將 user_progress / review_logs / exercise_bank 指向保留的那筆後刪除其他
+2. 同一文法項目有多筆 user_progress：保留進度最新的一筆
+3. 孤兒資料：指向不存在文法項目的進度、複習紀錄與題目
+4. 沒有進度的文法項目：補上 'new' 進度
+5. due_counts 與實際排程不一致：重新計算
+
+預設只輸出報告 (dry run)，加上 --fix 才會寫入。
+
+Usage:
+    python integrity_checker.py
+    python integrity_checker.py --fix
+"""
+
+import argparse
+import time
+
+import migrations
+
+# Survivor of each duplicate group: the earliest grammar point
+GRAMMAR_MERGE_SQL = '''
+    CREATE TEMP TABLE grammar_merge AS
+    SELECT id AS old_id, keep_id AS new_id FROM (
+        SELECT id,
+               FIRST_VALUE(id) OVER (
+                   PARTITION BY jlpt_level, grammar_concept ORDER BY created_at, id
+               ) AS keep_id
+        FROM grammar_points
+    )
+    WHERE id != keep_id
+'''
+
+ORPHAN_TABLES = ("user_progress", "review_logs", "exercise_bank")
+
+
+def _drop_temp_tables(cursor):
+    cursor.execute('DROP TABLE IF EXISTS temp.grammar_merge')
+
+
+def _due_count_drift(cursor):
+    """Days whose stored due count differs from the schedule."""
+    cursor.execute('''
+        WITH actual AS (
+            SELECT date(next_review_due) AS day, COUNT(*) AS count
+            FROM user_progress
+            WHERE status = 'active' AND next_review_due IS NOT NULL
+            GROUP BY date(next_review_due)
+        )
+        SELECT COUNT(*) FROM (
+            SELECT a.day FROM actual a
+            LEFT JOIN due_counts d ON d.day = a.day
+            WHERE d.count IS NOT a.count
+            UNION
+            SELECT d.day FROM due_counts d
+            LEFT JOIN actual a ON a.day = d.day
+            WHERE d.count != 0 AND a.day IS NULL
+        )
+    ''')
+    return cursor.fetchone()[0]
+
+
+def check_and_repair(db, dry_run=True):
+    """
+    Find and fix integrity problems in one transaction.
+
+    With dry_run the fixes are executed and then rolled back, so the report
+    shows exactly what --fix would change.
+
+    Returns:
+        dict: rows affected per problem, plus seconds taken
+    """
+    started = time.monotonic()
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        report = {}
+
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            _drop_temp_tables(cursor)
+
+            # 1. Duplicate grammar points -> repoint references, delete the extras
+            cursor.execute(GRAMMAR_MERGE_SQL)
+            cursor.execute('SELECT COUNT(*) FROM temp.grammar_merge')
+            report['duplicate_grammar_points'] = cursor.fetchone()[0]
+
+            # 2. Several progress rows for one grammar point (now or once merged) -> keep one.
+            # Ranked before the repoint below, which restamps updated_at.
+            report['duplicate_progress'] = migrations.collapse_duplicate_progress(cursor, 'temp.grammar_merge')
+
+            repointed = 0
+            for table in ORPHAN_TABLES:
+                cursor.execute(f'''
+                    UPDATE {table} SET grammar_id = m.new_id
+                    FROM temp.grammar_merge m
+                    WHERE {table}.grammar_id = m.old_id
+                ''')
+                repointed += cursor.rowcount
+            report['repointed_rows'] = repointed
+            cursor.execute('DELETE FROM grammar_points WHERE id IN (SELECT old_id FROM temp.grammar_merge)')
+            migrations.create_unique_progress_index(cursor)
+
+            # 3. Orphans
+            for table in ORPHAN_TABLES:
+                cursor.execute(f'''
+                    DELETE FROM {table}
+                    WHERE NOT EXISTS (SELECT 1 FROM grammar_points g WHERE g.id = {table}.grammar_id)
+                ''')
+                report[f'orphan_{table}'] = cursor.rowcount
+
+            # 4. Grammar points without progress
+            cursor.execute('''
+                INSERT INTO user_progress (grammar_id, status)
+                SELECT g.id, 'new' FROM grammar_points g
+                WHERE NOT EXISTS (SELECT 1 FROM user_progress u WHERE u.grammar_id = g.id)
+            ''')
+            report['missing_progress'] = cursor.rowcount
+
+            # 5. Due counts
+            report['due_count_drift_days'] = _due_count_drift(cursor)
+            if report['due_count_drift_days']:
+                migrations.rebuild_due_counts(cursor)
+
+            _drop_temp_tables(cursor)
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        report['seconds'] = round(time.monotonic() - started, 2)
+        report['dry_run'] = dry_run
+        return report
+
+
+def print_report(report):
+    labels = [
+        ("duplicate_grammar_points", "重複的文法項目"),
+        ("repointed_rows", "重新指向的關聯資料"),
+        ("duplicate_progress", "多餘的進度資料"),
+        ("orphan_user_progress", "孤兒進度"),
+        ("orphan_review_logs", "孤兒複習紀錄"),
+        ("orphan_exercise_bank", "孤兒題目"),
+        ("missing_progress", "缺少進度的文法項目"),
+        ("due_count_drift_days", "due_counts 不一致的天數"),
+    ]
+    for key, label in labels:
+        mark = "⚠️ " if report[key] else "✅"
+        print(f"{mark} {label}: {report[key]}")
+    total = sum(report[key] for key, _ in labels if key != 'repointed_rows')
+    if report['dry_run']:
+        print(f"\n(dry run，未寫入；共 {total} 項，加上 --fix 修復) {report['seconds']}s")
+    else:
+        print(f"\n✅ 已修復 {total} 項 ({report['seconds']}s)")
+
+
+def main():
+    from database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Check and repair knowledge_base.db integrity.")
+    parser.add_argument("--fix", action="store_true", help="Apply the fixes (default: dry-run report)")
+    args = parser.parse_args()
+
+    print_report(check_and_repair(DatabaseManager(), dry_run=not args.fix))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+import math
+import os
+import queue
+import threading
+import time
+
+import audio_manager
+from audio_cache import get_audio_cache
+
+# Default concurrency / timeout settings for batch generation
+MAX_WORKERS = int(os.getenv("LESSON_MAX_WORKERS", "5"))
+CARD_TIMEOUT = float(os.getenv("LESSON_CARD_TIMEOUT", "45"))  # seconds per card (LLM)
+PREFETCH_DEPTH = int(os.getenv("LESSON_PREFETCH_DEPTH", "3"))  # cards ahead of the current one to voice
+
+
+def fallback_content(card, error=None):
+    """Content used when a card cannot be generated in time."""
+    reason = f" ({error})" if error else ""
+    return {
+        "question": f"請使用「{card['grammar_concept']}」造一個句子。(AI 生成失敗{reason})",
+        "hint": f"這個文法的意思是：{card.get('meaning', '')}",
+        "context": "Error Fallback"
+    }
+
+
+def audio_text(content):
+    """The sentence voiced for a lesson (its model answer)."""
+    return content.get('example_sentence', content.get('question', ''))
+
+
+def assign_audio_key(ai_content):
+    """
+    Sets a lesson's audio key without rendering it. Nothing is written to the
+    exercise bank: keys are recorded there only once the clip exists (build_audio).
+    """
+    # Content-addressed: same sentence + voice + options = same file
+    audio_key = audio_manager.audio_key(audio_text(ai_content))
+    ai_content['audio_key'] = audio_key
+    return audio_key
+
+
+def has_audio(content):
+    """True if an exercise's recorded audio key is current and its clip is in the cache."""
+    audio_key = content.get('audio_key')
+    return (audio_key == audio_manager.audio_key(audio_text(content))
+            and get_audio_cache().contains(audio_key))
+
+
+def build_audio(ai_content, db=None):
+    """
+    Renders TTS for a lesson's answer sentence right away (used for pre-generation).
+    The key is recorded in the exercise bank only once the clip has been rendered.
+    """
+    audio_key = assign_audio_key(ai_content)
+    ai_content['audio_path'] = audio_manager.generate_audio(audio_text(ai_content))
+    if ai_content['audio_path'] and db is not None and ai_content.get('exercise_id'):
+        db.set_exercise_audio(ai_content['exercise_id'], audio_key)
+    return ai_content
+
+
+def build_card(ai, card, db=None):
+    """
+    Generates AI content for a single card (runs in a worker thread).
+
+    Audio is not rendered here; the session's AudioPrefetcher voices cards
+    shortly before they are reached.
+    """
+    if db is not None:
+        ai_content = ai.get_lesson_content(card, db)
+    else:
+        ai_content = ai.generate_lesson_content(card)
+
+    assign_audio_key(ai_content)
+
+    prepared = dict(card)
+    prepared.update(ai_content)
+    return prepared
+
+
+def prepare_cards(ai, candidates, max_workers=MAX_WORKERS, timeout=CARD_TIMEOUT,
+                  on_progress=None, on_result=None, should_stop=None, db=None):
+    """
+    Generates lesson content for all candidates concurrently.
+
+    Args:
+        ai (AITutor): Tutor used for lesson generation.
+        candidates (list): Card dicts from DatabaseManager.get_due_reviews().
+        max_workers (int): Maximum number of cards generated at the same time.
+        timeout (float): Seconds a single card may take before it falls back.
+                         The whole batch is bounded by
+                         timeout * ceil(len(candidates) / max_workers).
+        on_progress (callable): Called as on_progress(done, total, card) on the
+                                calling thread each time a card finishes.
+        on_result (callable): Called as on_result(index, card) with the card's
+                              position in `candidates` as soon as it is ready.
+        should_stop (callable): Polled between cards; returning True abandons
+                                the remaining cards.
+        db (DatabaseManager): When given, lessons are served from the exercise bank.
+
+    Returns:
+        list: Prepared cards, in the same order as `candidates`.
+    """
+    total = len(candidates)
+    results = [None] * total
+    if not total:
+        return results
+
+    # Each card runs on its own daemon thread: a card that times out is abandoned
+    # and stops counting against max_workers, so it cannot starve the cards behind it
+    finished = queue.Queue()  # (index, prepared card or None, error or None)
+
+    def run(i, card):
+        try:
+            finished.put((i, build_card(ai, card, db), None))
+        except Exception as e:
+            finished.put((i, None, e))
+
+    waiting = list(range(total))
+    running = {}  # index -> monotonic deadline
+    batch_deadline = time.monotonic() + timeout * math.ceil(total / max_workers)
+    done_count = 0
+
+    def finish(i, prepared):
+        nonlocal done_count
+        results[i] = prepared
+        done_count += 1
+        if on_result:
+            on_result(i, prepared)
+        if on_progress:
+            on_progress(done_count, total, prepared)
+
+    def give_up(i, reason):
+        print(f"Timeout generating card {candidates[i]['grammar_concept']}")
+        finish(i, dict(candidates[i], **fallback_content(candidates[i], reason)))
+
+    while waiting or running:
+        if should_stop and should_stop():
+            break
+
+        now = time.monotonic()
+        while waiting and len(running) < max_workers:
+            i = waiting.pop(0)
+            running[i] = now + timeout
+            threading.Thread(target=run, args=(i, candidates[i]), name=f"lesson-{i}", daemon=True).start()
+
+        # Sleep until a card finishes, the oldest running card times out, or (at most) 1s
+        wait_for = min(min(running.values()), batch_deadline) - now
+        try:
+            i, prepared, error = finished.get(timeout=min(1.0, max(0.05, wait_for)))
+        except queue.Empty:
+            pass
+        else:
+            # Results of abandoned cards arrive too late and are ignored
+            if running.pop(i, None) is not None:
+                if error is None:
+                    finish(i, prepared)
+                else:
+                    print(f"Error generating card {candidates[i]['grammar_concept']}: {error}")
+                    finish(i, dict(candidates[i], **fallback_content(candidates[i], error)))
+
+        now = time.monotonic()
+        for i in [i for i, deadline in running.items() if now >= deadline]:
+            del running[i]
+            give_up(i, "timeout")
+        if now >= batch_deadline:
+            for i in list(running) + waiting:
+                give_up(i, "timeout")
+            break
+
+    return results
+
+
+class AudioPrefetcher:
+    """
+    Renders a session's audio just ahead of the learner.
+
+    While card N is on screen, audio for cards N..N+depth is queued on the TTS
+    service, nearest card first. Audio for cards the learner has moved past,
+    or for a cancelled session, is withdrawn.
+    """
+
+    def __init__(self, depth=PREFETCH_DEPTH, service=None):
+        self.depth = depth
+        self.service = service or audio_manager.get_tts_service()
+        self._texts = {}    # session index -> (audio key, text)
+        self._futures = {}  # session index -> (audio key, Future)
+        self._current = 0
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def add(self, index, card):
+        """Registers a card as soon as it has been generated."""
+        if not card.get('audio_key'):
+            return
+        with self._lock:
+            self._texts[index] = (card['audio_key'], audio_text(card))
+            self._pump()
+
+    def advance(self, index):
+        """The learner is now on card `index`."""
+        with self._lock:
+            self._current = index
+            for passed in [i for i in self._futures if i < index]:
+                self._withdraw(passed)
+            self._pump()
+
+    def _pump(self):
+        if self._cancelled:
+            return
+        for i in range(self._current, self._current + self.depth + 1):
+            if i in self._texts and i not in self._futures:
+                key, text = self._texts[i]
+                self._futures[i] = (key, self.service.submit(text, priority=i - self._current))
+
+    def _withdraw(self, index):
+        key, future = self._futures.pop(index)
+        if not future.done():
+            self.service.cancel(key)
+
+    def path(self, card, timeout=audio_manager.TTS_TIMEOUT):
+        """
+        Audio for the card on screen: waits for its prefetch, or renders it now.
+
+        Returns:
+            str: Absolute mp3 path, or None on failure.
+        """
+        if not card.get('audio_key'):
+            return None
+        index = card.get('session_index')
+        with self._lock:
+            entry = self._futures.get(index)
+            if entry is not None and self._stale(entry[1]):
+                entry = None  # rendered, but the clip has since been evicted from the cache
+            if entry is None or entry[1].cancelled():
+                entry = (card['audio_key'], self.service.submit(audio_text(card), priority=audio_manager.PRIORITY_NOW))
+                if index is not None and not self._cancelled:
+                    self._futures[index] = entry
+        try:
+            return entry[1].result(timeout)
+        except Exception as e:
+            print(f"[Audio] Could not render audio for {card.get('grammar_concept')}: {e}")
+            return None
+
+    @staticmethod
+    def _stale(future):
+        return (future.done() and not future.cancelled() and future.exception() is None
+                and not os.path.exists(future.result()))
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            for index in list(self._futures):
+                self._withdraw(index)
+            self._texts.clear()
+
+
+class SessionProducer:
+    """
+    Generates a session's cards in a background thread and hands them out in order.
+
+    The producer lives in st.session_state, so it keeps running across Streamlit
+    reruns. Cards are released strictly in candidate order and each card is
+    released exactly once, even if take_ready() is called from several reruns.
+    Each card carries its 'session_index', and its audio is prefetched by
+    `self.audio` as the learner gets close to it.
+    """
+
+    def __init__(self, ai, candidates, max_workers=MAX_WORKERS, timeout=CARD_TIMEOUT, db=None,
+                 prefetch_depth=PREFETCH_DEPTH):
+        self.ai = ai
+        self.db = db
+        self.audio = AudioPrefetcher(prefetch_depth)
+        self.candidates = list(candidates)
+        self.total = len(self.candidates)
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+        self._ready = {}      # index -> prepared card, not yet handed out
+        self._next_index = 0  # index of the next card to hand out
+        self._finished = False
+        self._cancelled = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="session-producer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            prepare_cards(
+                self.ai,
+                self.candidates,
+                max_workers=self.max_workers,
+                timeout=self.timeout,
+                on_result=self._on_result,
+                should_stop=lambda: self._cancelled,
+                db=self.db
+            )
+        except Exception as e:
+            print(f"Session producer error: {e}")
+        finally:
+            with self._cond:
+                # Anything never produced (cancel/crash) is skipped rather than blocking the queue
+                self._finished = True
+                self._cond.notify_all()
+
+    def _on_result(self, index, card):
+        card['session_index'] = index
+        self.audio.add(index, card)
+        with self._cond:
+            if index >= self._next_index:
+                self._ready[index] = card
+            self._cond.notify_all()
+
+    def take_ready(self):
+        """Returns (and releases) all cards that are ready, in order."""
+        cards = []
+        with self._cond:
+            while self._next_index in self._ready:
+                cards.append(self._ready.pop(self._next_index))
+                self._next_index += 1
+            if self._finished:
+                # Release remaining out-of-order cards, skipping lost ones
+                for index in sorted(self._ready):
+                    cards.append(self._ready.pop(index))
+                self._next_index = self.total
+        return cards
+
+    def wait_next(self, timeout=None):
+        """Blocks until the next card is ready (or nothing more will come)."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._next_index in self._ready or self._finished or self._cancelled,
+                timeout=timeout
+            )
+
+    @property
+    def pending(self):
+        """Number of cards not yet handed out."""
+        with self._cond:
+            if self._finished:
+                return len(self._ready)
+            return self.total - self._next_index
+
+    def cancel(self):
+        self.audio.cancel()
+        with self._cond:
+            self._cancelled = True
+            self._ready.clear()
+            self._next_index = self.total
+            self._cond.notify_all()
@@ -0,0 +1,662 @@
+"""
+資料庫架構版本管理 (Schema Migrations)
+
+schema_version 表記錄已套用的版本；DatabaseManager 啟動時會依序套用
+尚未執行的 migration，直接就地升級現有資料庫（不需刪除重建）。
+
+- 每個 migration 都可重複執行（IF NOT EXISTS / 補欄位），
+  因此沒有 schema_version 的舊資料庫會從第 1 版開始安全地補齊
+- 一般 migration 在單一交易中執行，並與版本紀錄一起提交
+- 建立索引時每個索引各自一個短交易，WAL 模式下讀取不受影響
+- 需要改變限制條件 (constraint) 的資料表以「分批複製到新表 → 短交易切換」進行
+
+新增 migration：在檔案最後加一個 @migration(下一個版本號, "說明") 函式。
+
+Usage:
+    python migrations.py            # 套用所有未執行的 migration
+    python migrations.py --status   # 只顯示版本狀態
+"""
+
+import argparse
+import sqlite3
+
+# JLPT levels as a small integer rank: 1 = easiest (N5) ... 5 = hardest (N1).
+# Unknown labels sort last.
+LEVEL_RANKS = {'N5': 1, 'N4': 2, 'N3': 3, 'N2': 4, 'N1': 5}
+UNKNOWN_LEVEL_RANK = 99
+LEVEL_RANK_SQL = "CASE {col} " + " ".join(
+    f"WHEN '{level}' THEN {rank}" for level, rank in LEVEL_RANKS.items()
+) + f" ELSE {UNKNOWN_LEVEL_RANK} END"
+
+COPY_BATCH_SIZE = 5000
+
+MIGRATIONS = []  # (version, name, function, transactional), in version order
+
+
+def migration(version, name, transactional=True):
+    """
+    Register a migration step.
+
+    Transactional steps receive a cursor inside an open transaction.
+    Non-transactional steps receive the connection and commit on their own
+    (long-running work split into short transactions).
+    """
+    def register(func):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append((version, name, func, transactional))
+        return func
+    return register
+
+
+# --- Runner ---
+
+def _ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+
+def current_version(conn):
+    """Applied schema version (0 for a new or pre-migrations database)."""
+    try:
+        cursor = conn.execute('SELECT MAX(version) FROM schema_version')
+    except sqlite3.OperationalError:
+        return 0
+    return cursor.fetchone()[0] or 0
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def migrate(conn, target=None, verbose=False):
+    """
+    Apply every migration newer than the database's version.
+
+    Args:
+        conn: sqlite3 connection (no open transaction).
+        target (int): Stop after this version (default: latest).
+
+    Returns:
+        list: Versions that were applied.
+    """
+    _ensure_version_table(conn)
+    applied = []
+
+    for version, name, func, transactional in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        if version <= current_version(conn):
+            continue
+        if verbose:
+            print(f"Applying migration {version}: {name}")
+
+        if transactional:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Another process may have applied it while we waited for the lock
+                if version <= current_version(conn):
+                    conn.rollback()
+                    continue
+                func(conn.cursor())
+                _record(conn, version, name)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        else:
+            func(conn)
+            with conn:
+                _record(conn, version, name)
+        applied.append(version)
+
+    return applied
+
+
+def _record(conn, version, name):
+    conn.execute('INSERT OR IGNORE INTO schema_version (version, name) VALUES (?, ?)', (version, name))
+
+
+# --- Helpers ---
+
+def ensure_column(cursor, table, column, definition):
+    """Add a column to an existing table if it is missing."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def create_indexes_online(conn, statements):
+    """Build indexes one short transaction at a time (readers continue under WAL)."""
+    for statement in statements:
+        with conn:
+            conn.execute(statement)
+
+
+def has_unique_index(cursor, table, columns):
+    """True if a UNIQUE index/constraint covers exactly these columns."""
+    cursor.execute(f"PRAGMA index_list({table})")
+    for _, index_name, unique, *_ in cursor.fetchall():
+        if not unique:
+            continue
+        cursor.execute(f"PRAGMA index_info({index_name})")
+        if [row[2] for row in cursor.fetchall()] == list(columns):
+            return True
+    return False
+
+
+def copy_table_batched(conn, source, target, columns, batch_size=COPY_BATCH_SIZE, after_id=0):
+    """
+    Copy rows with id > after_id from source to target in id order, one short
+    transaction per batch, so the app keeps running during the copy.
+    Rows violating the target's constraints are skipped (INSERT OR IGNORE).
+
+    Returns:
+        int: The last copied id.
+    """
+    column_list = ", ".join(columns)
+    last_id = after_id
+    while True:
+        with conn:
+            cursor = conn.execute(f'''
+                SELECT MAX(id) FROM (SELECT id FROM {source} WHERE id > ? ORDER BY id LIMIT ?)
+            ''', (last_id, batch_size))
+            batch_end = cursor.fetchone()[0]
+            if batch_end is None:
+                return last_id
+            conn.execute(f'''
+                INSERT OR IGNORE INTO {target} ({column_list})
+                SELECT {column_list} FROM {source}
+                WHERE id > ? AND id <= ?
+                ORDER BY id
+            ''', (last_id, batch_end))
+        last_id = batch_end
+
+
+def rebuild_due_counts(cursor):
+    """Recompute the per-day due counts from user_progress."""
+    cursor.execute('DELETE FROM due_counts')
+    cursor.execute('''
+        INSERT INTO due_counts (day, count)
+        SELECT date(next_review_due), COUNT(*)
+        FROM user_progress
+        WHERE status = 'active' AND next_review_due IS NOT NULL
+        GROUP BY date(next_review_due)
+    ''')
+
+
+# Which progress row survives when a grammar point has several
+PROGRESS_KEEP_ORDER = ("status = 'active' DESC, updated_at DESC, repetition_streak DESC, "
+                       "interval DESC, next_review_due DESC, id")
+# Same, for rows whose updated_at can no longer be trusted
+PROGRESS_FURTHEST_ORDER = "status = 'active' DESC, repetition_streak DESC, interval DESC, next_review_due DESC, id"
+
+
+def collapse_duplicate_progress(cursor, repoint=None, order=PROGRESS_KEEP_ORDER):
+    """
+    Keep one user_progress row per grammar point: active before new, then the
+    most recently updated / furthest along.
+
+    `repoint` names a table of (old_id, new_id) grammar points about to be
+    merged. Call this *before* repointing: rows are ranked together with the
+    point they merge into while their updated_at is still their own (the
+    change trigger restamps it on repoint), and the repoint then cannot
+    create duplicates.
+
+    Returns:
+        int: Rows deleted.
+    """
+    target = 'COALESCE(r.new_id, p.grammar_id)' if repoint else 'p.grammar_id'
+    join = f'LEFT JOIN {repoint} r ON r.old_id = p.grammar_id' if repoint else ''
+    cursor.execute(f'''
+        DELETE FROM user_progress WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY target ORDER BY {order}) AS rank
+                FROM (SELECT p.*, {target} AS target FROM user_progress p {join})
+            )
+            WHERE rank > 1
+        )
+    ''')
+    return cursor.rowcount
+
+
+def create_unique_progress_index(cursor):
+    """One progress row per grammar point (replaces the plain grammar_id index)."""
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_user_progress_grammar_unique
+        ON user_progress (grammar_id)
+    ''')
+    cursor.execute('DROP INDEX IF EXISTS idx_user_progress_grammar')
+
+
+def _create_grammar_level_rank_triggers(cursor):
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_grammar_points_level_rank_insert
+        AFTER INSERT ON grammar_points
+        BEGIN
+            UPDATE grammar_points SET level_rank = {LEVEL_RANK_SQL.format(col='NEW.jlpt_level')}
+            WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_grammar_points_level_rank_update
+        AFTER UPDATE OF jlpt_level ON grammar_points
+        BEGIN
+            UPDATE grammar_points SET level_rank = {LEVEL_RANK_SQL.format(col='NEW.jlpt_level')}
+            WHERE id = NEW.id;
+            UPDATE user_progress SET level_rank = {LEVEL_RANK_SQL.format(col='NEW.jlpt_level')}
+            WHERE grammar_id = NEW.id;
+        END
+    ''')
+
+
+# --- Migrations ---
+
+@migration(1, "base tables")
+def _base_tables(cursor):
+    # Table: Grammar Points (The Content)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS grammar_points (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            jlpt_level TEXT NOT NULL,
+            grammar_concept TEXT NOT NULL,
+            meaning TEXT,
+            structure TEXT,
+            explanation TEXT,
+            tags TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(jlpt_level, grammar_concept)
+        )
+    ''')
+
+    # Table: User Progress (The State)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_progress (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            grammar_id INTEGER NOT NULL,
+            next_review_due TIMESTAMP,
+            interval INTEGER DEFAULT 0,
+            efactor REAL DEFAULT 2.5,
+            repetition_streak INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'new',
+            FOREIGN KEY (grammar_id) REFERENCES grammar_points(id)
+        )
+    ''')
+
+    # Table: Logs (The History)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS review_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            grammar_id INTEGER NOT NULL,
+            quality_rating INTEGER NOT NULL,
+            review_type TEXT,
+            reviewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (grammar_id) REFERENCES grammar_points(id)
+        )
+    ''')
+
+
+@migration(2, "review queue indexes", transactional=False)
+def _query_indexes(conn):
+    # idx_user_progress_status_due is replaced in migration 11 (its order did not match the due query)
+    create_indexes_online(conn, [
+        '''CREATE INDEX IF NOT EXISTS idx_user_progress_status_due
+           ON user_progress (status, next_review_due, grammar_id, interval, efactor, repetition_streak)''',
+        '''CREATE INDEX IF NOT EXISTS idx_user_progress_grammar
+           ON user_progress (grammar_id)''',
+        '''CREATE INDEX IF NOT EXISTS idx_review_logs_grammar_reviewed
+           ON review_logs (grammar_id, reviewed_at)'''
+    ])
+
+
+@migration(3, "level rank")
+def _level_rank(cursor):
+    # Numeric level rank, stored on grammar_points and mirrored onto
+    # user_progress so it can be indexed together with status.
+    ensure_column(cursor, 'grammar_points', 'level_rank', 'INTEGER')
+    ensure_column(cursor, 'user_progress', 'level_rank', 'INTEGER')
+    cursor.execute(f'''
+        UPDATE grammar_points SET level_rank = {LEVEL_RANK_SQL.format(col='jlpt_level')}
+        WHERE level_rank IS NULL
+    ''')
+    cursor.execute('''
+        UPDATE user_progress
+        SET level_rank = (SELECT g.level_rank FROM grammar_points g WHERE g.id = user_progress.grammar_id)
+        WHERE level_rank IS NULL
+    ''')
+    _create_grammar_level_rank_triggers(cursor)
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_user_progress_level_rank
+        AFTER INSERT ON user_progress
+        BEGIN
+            UPDATE user_progress
+            SET level_rank = (SELECT level_rank FROM grammar_points WHERE id = NEW.grammar_id)
+            WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_user_progress_level_rank_repoint
+        AFTER UPDATE OF grammar_id ON user_progress
+        BEGIN
+            UPDATE user_progress
+            SET level_rank = (SELECT level_rank FROM grammar_points WHERE id = NEW.grammar_id)
+            WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_progress_status_level
+        ON user_progress (status, level_rank, grammar_id)
+    ''')
+
+
+@migration(4, "review event ids")
+def _review_event_ids(cursor):
+    # Review event ids make log writes idempotent (journal replay, sync)
+    ensure_column(cursor, 'review_logs', 'event_id', 'TEXT')
+    cursor.execute('''
+        UPDATE review_logs SET event_id = lower(hex(randomblob(16)))
+        WHERE event_id IS NULL
+    ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_review_logs_event
+        ON review_logs (event_id)
+    ''')
+
+
+@migration(5, "FSRS memory state")
+def _fsrs_state(cursor):
+    # Memory state for the FSRS scheduler (NULL while scheduled by SM-2)
+    ensure_column(cursor, 'user_progress', 'stability', 'REAL')
+    ensure_column(cursor, 'user_progress', 'difficulty', 'REAL')
+
+
+@migration(6, "due counts")
+def _due_counts(cursor):
+    # Table: Due Counts (reviews due per day, kept current by triggers;
+    # used to load-balance new due dates)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS due_counts (
+            day TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_due_counts_insert
+        AFTER INSERT ON user_progress
+        WHEN NEW.status = 'active' AND NEW.next_review_due IS NOT NULL
+        BEGIN
+            INSERT INTO due_counts (day, count) VALUES (date(NEW.next_review_due), 1)
+            ON CONFLICT(day) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_due_counts_update
+        AFTER UPDATE OF next_review_due, status ON user_progress
+        BEGIN
+            UPDATE due_counts SET count = count - 1
+            WHERE OLD.status = 'active' AND OLD.next_review_due IS NOT NULL
+              AND day = date(OLD.next_review_due);
+            INSERT INTO due_counts (day, count)
+            SELECT date(NEW.next_review_due), 1
+            WHERE NEW.status = 'active' AND NEW.next_review_due IS NOT NULL
+            ON CONFLICT(day) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_due_counts_delete
+        AFTER DELETE ON user_progress
+        WHEN OLD.status = 'active' AND OLD.next_review_due IS NOT NULL
+        BEGIN
+            UPDATE due_counts SET count = count - 1 WHERE day = date(OLD.next_review_due);
+        END
+    ''')
+    rebuild_due_counts(cursor)
+
+
+@migration(7, "exercise bank")
+def _exercise_bank(cursor):
+    # Table: Exercise Bank (Generated lessons, reused across sessions)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS exercise_bank (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            grammar_id INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            context TEXT,
+            hint TEXT,
+            example_sentence TEXT,
+            audio_key TEXT,
+            times_shown INTEGER DEFAULT 0,
+            last_shown_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (grammar_id) REFERENCES grammar_points(id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_exercise_bank_rotation
+        ON exercise_bank (grammar_id, last_shown_at)
+    ''')
+
+
+@migration(8, "change tracking for delta sync")
+def _change_tracking(cursor):
+    # Every insert/update of progress and every new log gets the next value
+    # of a database-wide sequence (the sync watermark) and a UTC updated_at
+    # for last-writer-wins merges (see progress_io.py).
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_meta (
+            key TEXT PRIMARY KEY,
+            value NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO sync_meta (key, value) VALUES ('change_seq', 0)")
+    cursor.execute('''
+        INSERT OR IGNORE INTO sync_meta (key, value)
+        VALUES ('device_id', lower(hex(randomblob(8))))
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_peers (
+            device_id TEXT PRIMARY KEY,
+            received_seq INTEGER NOT NULL DEFAULT 0,
+            acked_seq INTEGER NOT NULL DEFAULT 0,
+            synced_at TIMESTAMP
+        )
+    ''')
+
+    ensure_column(cursor, 'user_progress', 'updated_at', 'TEXT')
+    ensure_column(cursor, 'user_progress', 'change_seq', 'INTEGER')
+    ensure_column(cursor, 'review_logs', 'change_seq', 'INTEGER')
+    # Rows that predate change tracking: sequence 1, last review as updated_at
+    cursor.execute('''
+        UPDATE user_progress
+        SET change_seq = 1,
+            updated_at = COALESCE(updated_at, (
+                SELECT MAX(l.reviewed_at) FROM review_logs l WHERE l.grammar_id = user_progress.grammar_id
+            ))
+        WHERE change_seq IS NULL
+    ''')
+    cursor.execute('UPDATE review_logs SET change_seq = 1 WHERE change_seq IS NULL')
+    cursor.execute("UPDATE sync_meta SET value = MAX(value, 1) WHERE key = 'change_seq'")
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_user_progress_change_insert
+        AFTER INSERT ON user_progress
+        BEGIN
+            UPDATE sync_meta SET value = value + 1 WHERE key = 'change_seq';
+            UPDATE user_progress
+            SET change_seq = (SELECT value FROM sync_meta WHERE key = 'change_seq'),
+                updated_at = COALESCE(NEW.updated_at, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+            WHERE id = NEW.id;
+        END
+    ''')
+    # An explicitly written updated_at (sync merge) is kept as-is
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_user_progress_change_update
+        AFTER UPDATE OF grammar_id, status, interval, efactor, repetition_streak,
+                        next_review_due, stability, difficulty ON user_progress
+        BEGIN
+            UPDATE sync_meta SET value = value + 1 WHERE key = 'change_seq';
+            UPDATE user_progress
+            SET change_seq = (SELECT value FROM sync_meta WHERE key = 'change_seq'),
+                updated_at = CASE WHEN NEW.updated_at IS OLD.updated_at
+                                  THEN strftime('%Y-%m-%d %H:%M:%f', 'now')
+                                  ELSE NEW.updated_at END
+            WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_review_logs_change_insert
+        AFTER INSERT ON review_logs
+        BEGIN
+            UPDATE sync_meta SET value = value + 1 WHERE key = 'change_seq';
+            UPDATE review_logs
+            SET change_seq = (SELECT value FROM sync_meta WHERE key = 'change_seq')
+            WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_progress_change_seq
+        ON user_progress (change_seq)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_review_logs_change_seq
+        ON review_logs (change_seq)
+    ''')
+
+
+@migration(9, "grammar_points UNIQUE(jlpt_level, grammar_concept)", transactional=False)
+def _grammar_points_unique(conn):
+    """
+    Databases created before the UNIQUE constraint are upgraded in place
+    (this used to require rebuild_database.py to wipe the database):
+
+    1. Copy grammar_points into a new table with the constraint, in batches.
+       Duplicates are dropped; the earliest row of each group survives.
+    2. In one short transaction: copy rows added meanwhile, repoint progress,
+       logs and exercises from dropped duplicates to the survivor, collapse
+       the progress rows the repoint doubled up (and make them unique), then
+       swap the tables.
+    """
+    if has_unique_index(conn.cursor(), 'grammar_points', ('jlpt_level', 'grammar_concept')):
+        return
+
+    columns = ("id", "jlpt_level", "grammar_concept", "meaning", "structure",
+               "explanation", "tags", "created_at", "level_rank")
+    with conn:
+        conn.execute('DROP TABLE IF EXISTS grammar_points_new')
+        conn.execute('''
+            CREATE TABLE grammar_points_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                jlpt_level TEXT NOT NULL,
+                grammar_concept TEXT NOT NULL,
+                meaning TEXT,
+                structure TEXT,
+                explanation TEXT,
+                tags TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                level_rank INTEGER,
+                UNIQUE(jlpt_level, grammar_concept)
+            )
+        ''')
+    last_id = copy_table_batched(conn, 'grammar_points', 'grammar_points_new', columns)
+
+    # Old triggers/views keep referring to "grammar_points" across the swap
+    conn.execute('PRAGMA legacy_alter_table = ON')
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        cursor = conn.cursor()
+        column_list = ", ".join(columns)
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO grammar_points_new ({column_list})
+            SELECT {column_list} FROM grammar_points WHERE id > ? ORDER BY id
+        ''', (last_id,))
+
+        cursor.execute('''
+            CREATE TEMP TABLE grammar_repoint AS
+            SELECT o.id AS old_id, n.id AS new_id
+            FROM grammar_points o
+            JOIN grammar_points_new n
+              ON n.jlpt_level = o.jlpt_level AND n.grammar_concept = o.grammar_concept
+            WHERE n.id != o.id
+        ''')
+        collapse_duplicate_progress(cursor, 'temp.grammar_repoint')
+        for table in ('user_progress', 'review_logs', 'exercise_bank'):
+            cursor.execute(f'''
+                UPDATE {table} SET grammar_id = r.new_id
+                FROM temp.grammar_repoint r
+                WHERE {table}.grammar_id = r.old_id
+            ''')
+        cursor.execute('DROP TABLE temp.grammar_repoint')
+        create_unique_progress_index(cursor)
+
+        cursor.execute('DROP TABLE grammar_points')
+        cursor.execute('ALTER TABLE grammar_points_new RENAME TO grammar_points')
+        _create_grammar_level_rank_triggers(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute('PRAGMA legacy_alter_table = OFF')
+
+
+@migration(10, "seed file hashes")
+def _seed_files(cursor):
+    # Content hash of each loaded seed file; unchanged files are skipped on startup
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS seed_files (
+            filename TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            items INTEGER,
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+@migration(11, "review queue index in queue order", transactional=False)
+def _due_queue_index(conn):
+    # The due query orders by (level_rank, next_review_due): an index in that
+    # order (covering the selected progress columns) is walked without a sort.
+    # It replaces idx_user_progress_status_due, whose order did not match.
+    create_indexes_online(conn, [
+        '''CREATE INDEX IF NOT EXISTS idx_user_progress_status_level_due
+           ON user_progress (status, level_rank, next_review_due, grammar_id,
+                             interval, efactor, repetition_streak, stability, difficulty)''',
+        '''DROP INDEX IF EXISTS idx_user_progress_status_due'''
+    ])
+
+
+@migration(12, "one progress row per grammar point")
+def _unique_progress(cursor):
+    # Databases that ran migration 9 before it collapsed repointed progress.
+    # That repoint restamped updated_at on the merged rows, so rank by progress.
+    collapse_duplicate_progress(cursor, order=PROGRESS_FURTHEST_ORDER)
+    create_unique_progress_index(cursor)
+
+
+def main():
+    from database_manager import DB_PATH
+
+    parser = argparse.ArgumentParser(description="Upgrade the database schema in place.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--status", action="store_true", help="Only show the schema version")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        print(f"Schema version: {current_version(conn)} (latest: {latest_version()})")
+        if not args.status:
+            applied = migrate(conn, verbose=True)
+            print(f"Applied {len(applied)} migrations, now at version {current_version(conn)}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Streaming NDJSON backup / sync format for grammar points, progress and review logs.
+
+One JSON object per line, optionally gzip-compressed:
+
+    {"type": "header", "format": "japanese-tutor-ndjson", "version": 2,
+     "device_id": "...", "since": 0, "watermark": 1234, "acks": {"<peer>": 987}}
+    {"type": "grammar_point", "jlpt_level": "N5", "grammar_concept": "...", ...}
+    {"type": "progress", "jlpt_level": "N5", "grammar_concept": "...", "interval": 6, ...}
+    {"type": "log", "jlpt_level": "N5", "grammar_concept": "...", "quality_rating": 4, ...}
+
+Rows reference grammar points by (jlpt_level, grammar_concept) so files can be
+moved between databases. Export and import both run in constant memory.
+
+Delta sync: every progress/log change gets the next value of a database-wide
+change sequence (see migrations.py). A delta export only holds rows
+with since < change_seq <= watermark. Importing is idempotent: progress is
+merged last-writer-wins on updated_at and logs are de-duplicated by event_id.
+Each device remembers how far it has received every peer's changes and sends
+that back as "acks", so the next delta for a peer starts where the peer
+confirmed receipt (a lost file is simply re-sent).
+"""
+
+import gzip
+import io
+import json
+from datetime import datetime
+
+FORMAT_NAME = "japanese-tutor-ndjson"
+FORMAT_VERSION = 2
+FETCH_SIZE = 5000
+IMPORT_CHUNK = 5000
+GZIP_MAGIC = b"\x1f\x8b"
+
+GRAMMAR_FIELDS = ("jlpt_level", "grammar_concept", "meaning", "structure", "explanation", "tags")
+PROGRESS_FIELDS = ("jlpt_level", "grammar_concept", "status", "interval", "efactor",
+                   "repetition_streak", "next_review_due", "stability", "difficulty", "updated_at")
+LOG_FIELDS = ("jlpt_level", "grammar_concept", "quality_rating", "review_type", "reviewed_at", "event_id")
+
+
+def _iter_rows(conn, sql, params=()):
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        yield from rows
+
+
+# --- Sync state ---
+
+def get_device_id(conn):
+    cursor = conn.execute("SELECT value FROM sync_meta WHERE key = 'device_id'")
+    return cursor.fetchone()[0]
+
+
+def get_sync_peers(db):
+    """
+    Devices this database has imported from.
+
+    Returns:
+        list: dicts with device_id, received_seq (their changes we hold),
+              acked_seq (our changes they confirmed holding) and synced_at
+    """
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT device_id, received_seq, acked_seq, synced_at
+            FROM sync_peers ORDER BY synced_at DESC
+        ''')
+        return [
+            {"device_id": row[0], "received_seq": row[1], "acked_seq": row[2], "synced_at": row[3]}
+            for row in cursor.fetchall()
+        ]
+
+
+def peer_watermark(db, device_id):
+    """Watermark to export a delta for a peer from (0 = everything)."""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT acked_seq FROM sync_peers WHERE device_id = ?', (device_id,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+
+def _record_peer(conn, header):
+    """Remember what a peer sent us and how much of ours it confirmed."""
+    device_id = header.get('device_id')
+    if not device_id or device_id == get_device_id(conn):
+        return
+    acked = (header.get('acks') or {}).get(get_device_id(conn), 0)
+    conn.execute('''
+        INSERT INTO sync_peers (device_id, received_seq, acked_seq, synced_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(device_id) DO UPDATE SET
+            received_seq = MAX(received_seq, excluded.received_seq),
+            acked_seq = MAX(acked_seq, excluded.acked_seq),
+            synced_at = excluded.synced_at
+    ''', (device_id, int(header.get('watermark') or 0), int(acked)))
+
+
+# --- Export ---
+
+def iter_export_records(db, since=0):
+    """
+    Yields export records (dicts), header first.
+
+    Args:
+        since (int): Only rows changed after this watermark (0 = full backup).
+    """
+    conn = db.get_connection()
+    try:
+        # One read transaction: the watermark and every row come from the same snapshot
+        conn.execute('BEGIN')
+        watermark = int(conn.execute("SELECT value FROM sync_meta WHERE key = 'change_seq'").fetchone()[0])
+        acks = dict(conn.execute('SELECT device_id, received_seq FROM sync_peers').fetchall())
+        yield {
+            "type": "header",
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "export_date": datetime.now().isoformat(),
+            "device_id": get_device_id(conn),
+            "since": since,
+            "watermark": watermark,
+            "acks": acks
+        }
+
+        if since:
+            # Only the points referenced by changed rows
+            points = _iter_rows(conn, '''
+                SELECT jlpt_level, grammar_concept, meaning, structure, explanation, tags
+                FROM grammar_points
+                WHERE id IN (SELECT grammar_id FROM user_progress WHERE change_seq > ? AND status != 'new')
+                   OR id IN (SELECT grammar_id FROM review_logs WHERE change_seq > ?)
+                ORDER BY id
+            ''', (since, since))
+        else:
+            points = _iter_rows(conn, '''
+                SELECT jlpt_level, grammar_concept, meaning, structure, explanation, tags
+                FROM grammar_points ORDER BY id
+            ''')
+        for row in points:
+            yield dict(zip(GRAMMAR_FIELDS, row), type="grammar_point")
+
+        for row in _iter_rows(conn, '''
+            SELECT g.jlpt_level, g.grammar_concept, u.status, u.interval, u.efactor,
+                   u.repetition_streak, u.next_review_due, u.stability, u.difficulty, u.updated_at
+            FROM user_progress u
+            JOIN grammar_points g ON g.id = u.grammar_id
+            WHERE u.change_seq > ? AND u.status != 'new'
+            ORDER BY u.change_seq
+        ''', (since,)):
+            yield dict(zip(PROGRESS_FIELDS, row), type="progress")
+
+        for row in _iter_rows(conn, '''
+            SELECT g.jlpt_level, g.grammar_concept, l.quality_rating, l.review_type,
+                   l.reviewed_at, l.event_id
+            FROM review_logs l
+            JOIN grammar_points g ON g.id = l.grammar_id
+            WHERE l.change_seq > ?
+            ORDER BY l.change_seq
+        ''', (since,)):
+            yield dict(zip(LOG_FIELDS, row), type="log")
+    finally:
+        conn.close()
+
+
+def export_ndjson(db, fileobj, compress=True, since=0):
+    """
+    Write a full backup (since=0) or a delta to a binary file object.
+
+    Returns:
+        dict: number of records written per type, plus the export watermark
+    """
+    stream = gzip.GzipFile(fileobj=fileobj, mode='wb') if compress else fileobj
+    counts = {"grammar_point": 0, "progress": 0, "log": 0, "watermark": 0}
+    try:
+        for record in iter_export_records(db, since):
+            stream.write((json.dumps(record, ensure_ascii=False, default=str) + "\n").encode('utf-8'))
+            if record['type'] == 'header':
+                counts['watermark'] = record['watermark']
+            else:
+                counts[record['type']] += 1
+    finally:
+        if compress:
+            stream.close()  # Writes the gzip trailer; leaves fileobj open
+    return counts
+
+
+# --- Import ---
+
+def _open_text(fileobj):
+    """Text stream over a binary file object, transparently un-gzipping."""
+    if fileobj.seekable():
+        start = fileobj.tell()
+        head = fileobj.read(2)
+        fileobj.seek(start)
+    else:
+        fileobj = io.BufferedReader(fileobj)
+        head = fileobj.peek(2)[:2]
+    if head == GZIP_MAGIC:
+        fileobj = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    return io.TextIOWrapper(fileobj, encoding='utf-8')
+
+
+def import_ndjson(db, fileobj):
+    """
+    Bulk-merge an NDJSON backup or delta (plain or gzip) into the database.
+
+    Records are staged into temp tables in chunks, then merged with one
+    set-based statement per table inside a single transaction:
+    grammar points are inserted if missing, progress rows are upserted
+    (newer updated_at wins) and review logs are de-duplicated by event_id.
+    Re-importing the same file changes nothing.
+
+    Returns:
+        dict: added / updated / skipped progress rows, logs_added, grammar_added
+    """
+    with db.connection() as conn:
+        text = _open_text(fileobj)
+
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for table, fields in (("import_points", GRAMMAR_FIELDS),
+                                  ("import_progress", PROGRESS_FIELDS),
+                                  ("import_logs", LOG_FIELDS)):
+                conn.execute(f'DROP TABLE IF EXISTS temp.{table}')
+                conn.execute(f'CREATE TEMP TABLE {table} ({", ".join(fields)})')
+
+            header = {}
+            staged = {"grammar_point": [], "progress": [], "log": []}
+            targets = {
+                "grammar_point": ("import_points", GRAMMAR_FIELDS),
+                "progress": ("import_progress", PROGRESS_FIELDS),
+                "log": ("import_logs", LOG_FIELDS)
+            }
+
+            def stage(kind):
+                table, fields = targets[kind]
+                placeholders = ", ".join("?" * len(fields))
+                conn.executemany(f'INSERT INTO temp.{table} VALUES ({placeholders})', staged[kind])
+                staged[kind] = []
+
+            for line_no, line in enumerate(text, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                kind = record.get('type')
+                if kind == 'header':
+                    if record.get('format') != FORMAT_NAME:
+                        raise ValueError(f"Not a {FORMAT_NAME} file")
+                    header = record
+                    continue
+                if kind not in targets:
+                    print(f"Skipping unknown record type on line {line_no}: {kind}")
+                    continue
+                staged[kind].append(tuple(record.get(field) for field in targets[kind][1]))
+                if len(staged[kind]) >= IMPORT_CHUNK:
+                    stage(kind)
+            for kind in staged:
+                if staged[kind]:
+                    stage(kind)
+
+            result = _merge_staged(conn)
+            _record_peer(conn, header)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            for table in ("import_points", "import_progress", "import_logs"):
+                conn.execute(f'DROP TABLE IF EXISTS temp.{table}')
+            text.detach()
+
+        result['since'] = header.get('since', 0)
+        result['watermark'] = header.get('watermark')
+        return result
+
+
+def _merge_staged(conn):
+    """Set-based merge of the staged temp tables (caller owns the transaction)."""
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        INSERT OR IGNORE INTO grammar_points (jlpt_level, grammar_concept, meaning, structure, explanation, tags)
+        SELECT jlpt_level, grammar_concept, meaning, structure, explanation, tags
+        FROM temp.import_points
+    ''')
+    grammar_added = cursor.rowcount
+
+    # Last writer wins; rows without updated_at (version 1 files) always apply
+    cursor.execute('''
+        UPDATE user_progress
+        SET status = i.status, interval = i.interval, efactor = i.efactor,
+            repetition_streak = i.repetition_streak, next_review_due = i.next_review_due,
+            stability = i.stability, difficulty = i.difficulty,
+            updated_at = COALESCE(i.updated_at, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        FROM temp.import_progress i
+        JOIN grammar_points g ON g.jlpt_level = i.jlpt_level AND g.grammar_concept = i.grammar_concept
+        WHERE user_progress.grammar_id = g.id
+          AND (i.updated_at IS NULL OR user_progress.updated_at IS NULL
+               OR i.updated_at > user_progress.updated_at)
+    ''')
+    updated = cursor.rowcount
+
+    # OR IGNORE: files exported before progress was unique may list a point twice
+    cursor.execute('''
+        INSERT OR IGNORE INTO user_progress (grammar_id, status, interval, efactor, repetition_streak,
+                                   next_review_due, stability, difficulty, updated_at)
+        SELECT g.id, i.status, i.interval, i.efactor, i.repetition_streak,
+               i.next_review_due, i.stability, i.difficulty, i.updated_at
+        FROM temp.import_progress i
+        JOIN grammar_points g ON g.jlpt_level = i.jlpt_level AND g.grammar_concept = i.grammar_concept
+        WHERE NOT EXISTS (SELECT 1 FROM user_progress u WHERE u.grammar_id = g.id)
+    ''')
+    added = cursor.rowcount
+
+    # Imported points without progress start as new cards
+    cursor.execute('''
+        INSERT OR IGNORE INTO user_progress (grammar_id, status)
+        SELECT g.id, 'new' FROM temp.import_points i
+        JOIN grammar_points g ON g.jlpt_level = i.jlpt_level AND g.grammar_concept = i.grammar_concept
+        WHERE NOT EXISTS (SELECT 1 FROM user_progress u WHERE u.grammar_id = g.id)
+    ''')
+
+    cursor.execute('SELECT COUNT(*) FROM temp.import_progress')
+    skipped = cursor.fetchone()[0] - updated - added
+
+    cursor.execute('''
+        INSERT OR IGNORE INTO review_logs (grammar_id, quality_rating, review_type, reviewed_at, event_id)
+        SELECT g.id, i.quality_rating, i.review_type, i.reviewed_at,
+               COALESCE(i.event_id, lower(hex(randomblob(16))))
+        FROM temp.import_logs i
+        JOIN grammar_points g ON g.jlpt_level = i.jlpt_level AND g.grammar_concept = i.grammar_concept
+    ''')
+    logs_added = cursor.rowcount
+
+    return {
+        "added": added,
+        "updated": updated,
+        "skipped": max(skipped, 0),
+        "logs_added": logs_added,
+        "grammar_added": grammar_added
+    }
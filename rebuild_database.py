@@ -1,43 +1,45 @@
 """
-測試資料庫架構更新
+資料庫架構更新
 
-此腳本會重建資料庫以應用新的 UNIQUE 約束。
-注意：這會刪除現有資料庫並重新創建！僅用於測試。
+此腳本會就地升級現有資料庫（套用 migrations.py 中尚未執行的版本，
+例如 grammar_points 的 UNIQUE 約束），不會刪除任何資料。
+升級前會先建立線上備份。
 """
 
 import os
-import shutil
-from datetime import datetime
-from database_manager import DatabaseManager
+import sqlite3
+
+import backup_manager
+import migrations
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "knowledge_base.db")
-BACKUP_PATH = os.path.join(os.path.dirname(__file__), f"knowledge_base_before_rebuild_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
 
 def rebuild_database():
-    """重建資料庫以應用新的架構"""
-    
+    """就地升級資料庫以應用新的架構"""
+
     print("=" * 60)
     print("資料庫架構更新工具")
     print("=" * 60)
-    
+
     # 備份現有資料庫
     if os.path.exists(DB_PATH):
-        shutil.copy2(DB_PATH, BACKUP_PATH)
-        print(f"\n✅ 已備份現有資料庫至: {BACKUP_PATH}")
-        
-        # 刪除舊資料庫
-        os.remove(DB_PATH)
-        print(f"🗑️  已刪除舊資料庫")
+        backup_path = backup_manager.create_backup(DB_PATH, label="before_migrate")
+        print(f"\n✅ 已備份現有資料庫至: {backup_path}")
     else:
-        print("\n⚠️  沒有找到現有資料庫")
-    
-    # 創建新資料庫（會使用新的架構）
-    print("\n🔨 正在創建新資料庫...")
-    db = DatabaseManager()
-    
-    print("✅ 新資料庫已創建，包含 UNIQUE 約束")
+        print("\n⚠️  沒有找到現有資料庫，將建立新資料庫")
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        print(f"\n🔨 目前版本: {migrations.current_version(conn)}，最新版本: {migrations.latest_version()}")
+
+        applied = migrations.migrate(conn, verbose=True)
+        print(f"✅ 已套用 {len(applied)} 個 migration，目前版本: {migrations.current_version(conn)}")
+    finally:
+        conn.close()
+
     print("\n" + "=" * 60)
-    print("完成！現在可以重新導入資料。")
+    print("完成！資料已保留，不需要重新導入。")
     print("=" * 60)
 
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+"""
+從 review_logs 重建 user_progress (Replay Engine)
+
+依時間順序重播每張卡片的所有複習紀錄，以指定的排程器重新計算
+interval / efactor / repetition (以及 FSRS 的 stability / difficulty)，
+並在單一交易中寫回資料庫。
+
+用途：
+- 「假如改用 FSRS / 新參數」的重新排程
+- 匯入出錯後，從歷史紀錄還原排程狀態
+
+記憶體用量固定：紀錄以串流方式讀取 (依 grammar_id, reviewed_at 排序)，
+同一時間只保留一張卡片的狀態，結果分批寫入暫存表。
+
+Usage:
+    python replay_engine.py --scheduler sm2 --dry-run
+    python replay_engine.py --scheduler fsrs
+    python replay_engine.py --scheduler fsrs --params candidate_params.json --dry-run
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+from fsrs_engine import DESIRED_RETENTION, FSRSEngine
+from srs_engine import get_scheduler
+
+FETCH_SIZE = 10000
+WRITE_CHUNK = 5000
+
+
+def replay_card(engine, reviews):
+    """
+    Fold one card's reviews through a scheduler.
+
+    Args:
+        engine: SRSEngine or FSRSEngine instance (see srs_engine.get_scheduler).
+        reviews (list): (quality, reviewed_at datetime) in chronological order.
+
+    Returns:
+        dict: interval, efactor, repetition, next_review_due, stability, difficulty
+    """
+    state = {"repetition": 0, "efactor": 2.5, "interval": 0, "stability": None, "difficulty": None}
+    last_reviewed = None
+
+    for quality, reviewed_at in reviews:
+        if engine.name == "fsrs":
+            elapsed = (reviewed_at - last_reviewed).total_seconds() / 86400 if last_reviewed else 0
+            result = engine.calculate_review(
+                quality, state['stability'], state['difficulty'], elapsed, state['repetition']
+            )
+            result['efactor'] = state['efactor']
+        else:
+            result = engine.calculate_review(quality, state['repetition'], state['efactor'], state['interval'])
+
+        state = {
+            "repetition": result['repetition'],
+            "efactor": result['efactor'],
+            "interval": result['interval'],
+            "stability": result.get('stability'),
+            "difficulty": result.get('difficulty')
+        }
+        last_reviewed = reviewed_at
+
+    state['next_review_due'] = last_reviewed + timedelta(days=state['interval'])
+    return state
+
+
+def iter_card_histories(conn, fetch_size=FETCH_SIZE):
+    """Yields (grammar_id, [(quality, reviewed_at), ...]) one card at a time."""
+    cursor = conn.cursor()
+    # reviewed_at is UTC (CURRENT_TIMESTAMP); due dates are stored in local time
+    cursor.execute('''
+        SELECT grammar_id, quality_rating, datetime(reviewed_at, 'localtime')
+        FROM review_logs
+        ORDER BY grammar_id, reviewed_at, id
+    ''')
+
+    current_id = None
+    reviews = []
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        for grammar_id, quality, reviewed_at in rows:
+            if grammar_id != current_id:
+                if reviews:
+                    yield current_id, reviews
+                current_id = grammar_id
+                reviews = []
+            reviews.append((quality, datetime.fromisoformat(reviewed_at)))
+    if reviews:
+        yield current_id, reviews
+
+
+def load_engine(scheduler, params=None):
+    """
+    Scheduler for a replay. `params` (FSRS only) is a params file path or a dict
+    shaped like it ({"params": [...], "desired_retention": ...}); without it the
+    shared fitted parameters are used. The shared file is never written.
+    """
+    if params is None:
+        return get_scheduler(scheduler)
+    if scheduler != "fsrs":
+        raise ValueError(f"Custom parameters are only supported for fsrs, not {scheduler}")
+    if isinstance(params, dict):
+        return FSRSEngine(params['params'], params.get('desired_retention', DESIRED_RETENTION))
+    if not os.path.exists(params):
+        raise FileNotFoundError(f"FSRS params file not found: {params}")
+    return FSRSEngine.load(params)
+
+
+def replay(db, scheduler="sm2", dry_run=False, params=None):
+    """
+    Rebuild scheduling state for every reviewed card from review_logs.
+
+    Args:
+        db (DatabaseManager): Target database.
+        scheduler (str): 'sm2' or 'fsrs' (FSRS uses the saved fitted parameters).
+        dry_run (bool): Compute everything but roll back instead of committing.
+        params (str | dict): FSRS parameters to replay with instead of the saved ones
+            (see load_engine).
+
+    Returns:
+        dict: cards replayed, reviews read, progress rows updated, seconds taken
+    """
+    engine = load_engine(scheduler, params)
+    started = time.monotonic()
+
+    # Stream from a separate connection so the writer's transaction stays independent
+    reader = db.get_connection()
+    with db.connection() as writer:
+        cards = 0
+        reviews_read = 0
+        try:
+            writer.execute('BEGIN IMMEDIATE')
+            writer.execute('DROP TABLE IF EXISTS temp.replay_results')
+            writer.execute('''
+                CREATE TEMP TABLE replay_results (
+                    grammar_id INTEGER PRIMARY KEY,
+                    interval INTEGER,
+                    efactor REAL,
+                    repetition_streak INTEGER,
+                    next_review_due TIMESTAMP,
+                    stability REAL,
+                    difficulty REAL
+                )
+            ''')
+
+            batch = []
+            for grammar_id, reviews in iter_card_histories(reader):
+                state = replay_card(engine, reviews)
+                batch.append((
+                    grammar_id, state['interval'], state['efactor'], state['repetition'],
+                    state['next_review_due'], state['stability'], state['difficulty']
+                ))
+                cards += 1
+                reviews_read += len(reviews)
+                if len(batch) >= WRITE_CHUNK:
+                    writer.executemany('INSERT INTO replay_results VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+                    batch = []
+            if batch:
+                writer.executemany('INSERT INTO replay_results VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+
+            cursor = writer.execute('''
+                UPDATE user_progress
+                SET interval = r.interval,
+                    efactor = r.efactor,
+                    repetition_streak = r.repetition_streak,
+                    next_review_due = r.next_review_due,
+                    stability = r.stability,
+                    difficulty = r.difficulty,
+                    status = 'active'
+                FROM replay_results r
+                WHERE user_progress.grammar_id = r.grammar_id
+            ''')
+            updated = cursor.rowcount
+            writer.execute('DROP TABLE temp.replay_results')
+
+            if dry_run:
+                writer.rollback()
+            else:
+                writer.commit()
+        except Exception:
+            writer.rollback()
+            raise
+        finally:
+            reader.close()
+
+        return {
+            "cards": cards,
+            "reviews": reviews_read,
+            "updated": updated,
+            "seconds": round(time.monotonic() - started, 2),
+            "dry_run": dry_run
+        }
+
+
+def main():
+    from database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Rebuild user_progress by replaying review_logs.")
+    parser.add_argument("--scheduler", choices=["sm2", "fsrs"], default="sm2")
+    parser.add_argument("--dry-run", action="store_true", help="Replay without saving")
+    parser.add_argument("--params", help="FSRS params JSON to replay with (default: the saved fitted parameters)")
+    args = parser.parse_args()
+    if args.params and args.scheduler != "fsrs":
+        parser.error("--params requires --scheduler fsrs")
+
+    result = replay(DatabaseManager(), args.scheduler, args.dry_run, params=args.params)
+    mode = "(dry run, nothing saved)" if result['dry_run'] else ""
+    print(f"Replayed {result['reviews']} reviews for {result['cards']} cards, "
+          f"updated {result['updated']} progress rows in {result['seconds']}s {mode}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import atexit
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+
+JOURNAL_PATH = os.path.join(os.path.dirname(__file__), "review_journal.ndjson")
+
+# Flush policy
+FLUSH_INTERVAL = float(os.getenv("REVIEW_FLUSH_INTERVAL", "5"))   # seconds
+FLUSH_SIZE = int(os.getenv("REVIEW_FLUSH_SIZE", "20"))            # buffered reviews
+
+
+class ReviewWriteBuffer:
+    """
+    Write-behind buffer for rating updates.
+
+    submit() appends the review to an append-only journal and keeps it in memory;
+    the batch is written to the database in one transaction when FLUSH_SIZE
+    reviews are pending, every FLUSH_INTERVAL seconds, or on flush() (session end).
+
+    Crash safety: the journal is rotated to `<journal>.flushing` before a batch is
+    applied and deleted afterwards. On startup both files are replayed through
+    DatabaseManager.apply_review_updates, which skips already-applied event ids.
+    """
+
+    def __init__(self, db, journal_path=JOURNAL_PATH, flush_interval=FLUSH_INTERVAL,
+                 flush_size=FLUSH_SIZE, fsync=False):
+        self.db = db
+        self.journal_path = journal_path
+        self.flushing_path = journal_path + ".flushing"
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.fsync = fsync  # fsync each journal append (power-loss safe, slower)
+
+        self._pending = []
+        self._lock = threading.Lock()        # guards _pending and the journal file
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._stop = threading.Event()
+
+        self.replay()
+
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._timer = threading.Thread(target=self._run_timer, name="review-flush", daemon=True)
+        self._timer.start()
+        atexit.register(self.close)
+
+    def replay(self):
+        """Apply reviews left in the journal by a previous (crashed) process."""
+        replayed = 0
+        for path in (self.flushing_path, self.journal_path):
+            if not os.path.exists(path):
+                continue
+            updates = []
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        updates.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Torn last line from a crash mid-write
+                        print(f"[Reviews] Skipping corrupt journal line in {path}")
+            replayed += self.db.apply_review_updates(updates)
+            os.remove(path)
+        if replayed:
+            print(f"[Reviews] Replayed {replayed} reviews from journal")
+        return replayed
+
+    def submit(self, progress_id, grammar_id, quality, interval, efactor, repetition, next_date,
+               stability=None, difficulty=None):
+        """Record a review (same arguments as DatabaseManager.update_progress)."""
+        entry = {
+            "event_id": uuid.uuid4().hex,
+            "progress_id": progress_id,
+            "grammar_id": grammar_id,
+            "quality": quality,
+            "interval": interval,
+            "efactor": efactor,
+            "repetition": repetition,
+            "next_review_due": str(next_date),
+            "stability": stability,
+            "difficulty": difficulty,
+            # Same format as SQLite's CURRENT_TIMESTAMP (UTC)
+            "reviewed_at": datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+        with self._lock:
+            self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._pending.append(entry)
+            should_flush = len(self._pending) >= self.flush_size
+
+        if should_flush:
+            self.flush()
+        return entry['event_id']
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def pending_due_counts(self):
+        """Reviews per due day among not-yet-flushed updates ({'YYYY-MM-DD': count})."""
+        counts = {}
+        with self._lock:
+            for entry in self._pending:
+                day = entry['next_review_due'][:10]
+                counts[day] = counts.get(day, 0) + 1
+        return counts
+
+    def flush(self):
+        """Write all pending reviews to the database in one transaction."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = []
+                self._rotate_journal()
+
+            try:
+                applied = self.db.apply_review_updates(batch)
+            except Exception as e:
+                # Keep the rotated journal; it is replayed on the next start
+                print(f"[Reviews] Flush failed, {len(batch)} reviews kept in journal: {e}")
+                with self._lock:
+                    self._pending = batch + self._pending
+                return 0
+
+            os.remove(self.flushing_path)
+            return applied
+
+    def _rotate_journal(self):
+        """Move journaled reviews aside so new submits go to a fresh file (caller holds _lock)."""
+        self._journal.close()
+        if os.path.exists(self.flushing_path):
+            # A previous flush failed: keep its (older) entries and add the new ones
+            with open(self.journal_path, 'r', encoding='utf-8') as src, \
+                    open(self.flushing_path, 'a', encoding='utf-8') as dst:
+                dst.write(src.read())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self.flushing_path)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def _run_timer(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[Reviews] Timer flush error: {e}")
+
+    def close(self):
+        """Stop the timer and flush everything (safe to call more than once)."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self.flush()
+        with self._lock:
+            self._journal.close()
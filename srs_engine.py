@@ -1,12 +1,18 @@
 import math
+import os
+import threading
 from datetime import datetime, timedelta
 
+import numpy as np
+
 class SRSEngine:
     """
     Implements the SuperMemo-2 (SM-2) Spaced Repetition Algorithm.
     Ref: https://www.supermemo.com/en/archives1990-2015/english/ol/sm2
     """
 
+    name = "sm2"
+
     @staticmethod
     def calculate_review(quality: int, repetition: int, efactor: float, previous_interval: int):
         """
@@ -67,6 +73,156 @@ class SRSEngine:
             "next_review_date": next_review_date
         }
 
+    @staticmethod
+    def schedule(card, quality, now=None):
+        """Schedule a card dict from DatabaseManager.get_due_reviews() (common scheduler interface)."""
+        return SRSEngine.calculate_review(quality, card['repetition'], card['efactor'], card['interval'])
+
+    @staticmethod
+    def fuzz_range(interval):
+        """
+        Window of acceptable intervals around an ideal interval (days).
+
+        Grows with the interval (15% up to a week, 10% up to 20 days, 5% beyond),
+        so short intervals stay exact and long ones get a few days of slack.
+        """
+        if interval < 3:
+            return interval, interval
+        delta = 1.0
+        delta += 0.15 * (min(interval, 7) - 2.5)
+        delta += 0.10 * max(min(interval, 20) - 7, 0)
+        delta += 0.05 * max(interval - 20, 0)
+        delta = int(round(delta))
+        return max(interval - delta, 2), interval + delta
+
+    @staticmethod
+    def load_balance(result, get_due_counts, now=None):
+        """
+        Move a scheduled review to the least-loaded day within its fuzz window.
+
+        Args:
+            result (dict): Output of a scheduler (interval, next_review_date, ...).
+            get_due_counts (callable): get_due_counts(start_date, end_date) ->
+                                       {'YYYY-MM-DD': count}, e.g. DatabaseManager.get_due_counts.
+            now (datetime): Reference time (default: now).
+
+        Returns:
+            dict: `result` with interval / next_review_date adjusted. Ties go to
+                  the day closest to the ideal interval, then the earlier day.
+        """
+        ideal = result['interval']
+        low, high = SRSEngine.fuzz_range(ideal)
+        if low == high:
+            return result
+
+        now = now or datetime.now()
+        today = now.date()
+        counts = get_due_counts(today + timedelta(days=low), today + timedelta(days=high))
+        best = min(
+            range(low, high + 1),
+            key=lambda days: (counts.get(str(today + timedelta(days=days)), 0), abs(days - ideal), days)
+        )
+
+        balanced = dict(result)
+        balanced['interval'] = best
+        balanced['next_review_date'] = now + timedelta(days=best)
+        return balanced
+
+    @staticmethod
+    def calculate_reviews_batch(quality, repetition, efactor, previous_interval, now=None):
+        """
+        Vectorized calculate_review for many cards at once.
+
+        Takes array-likes of equal length and gives results identical to calling
+        calculate_review on each element (next_review_date is computed from a
+        single `now` instead of one datetime.now() per card).
+
+        Args:
+            quality (array-like of int): User ratings (0-5).
+            repetition (array-like of int): Successful repetitions so far.
+            efactor (array-like of float): Easiness Factors.
+            previous_interval (array-like of int): Previous intervals in days.
+            now (datetime): Reference time for next_review_date (default: now).
+
+        Returns:
+            dict: {
+                "interval": np.ndarray[int64],
+                "repetition": np.ndarray[int64],
+                "efactor": np.ndarray[float64] (rounded to 4 places),
+                "next_review_date": np.ndarray[datetime64[us]]
+            }
+        """
+        quality = np.asarray(quality, dtype=np.int64)
+        repetition = np.asarray(repetition, dtype=np.int64)
+        efactor = np.asarray(efactor, dtype=np.float64)
+        previous_interval = np.asarray(previous_interval)
+
+        # 1. Update E-Factor (same operation order as the scalar path)
+        lapse = 5 - quality
+        new_efactor = efactor + (0.1 - lapse * (0.08 + lapse * 0.02))
+        new_efactor = np.where(new_efactor < 1.3, 1.3, new_efactor)
+
+        # 2. Update Repetition & Interval
+        correct = quality >= 3
+        grown = np.ceil(previous_interval * new_efactor).astype(np.int64)
+        interval = np.where(repetition == 0, 1, np.where(repetition == 1, 6, grown))
+        interval = np.where(correct, interval, 1).astype(np.int64)
+        new_repetition = np.where(correct, repetition + 1, 0).astype(np.int64)
+
+        if now is None:
+            now = datetime.now()
+        next_review_date = np.datetime64(now, 'us') + interval.astype('timedelta64[D]')
+
+        return {
+            "interval": interval,
+            "repetition": new_repetition,
+            "efactor": SRSEngine._round4(new_efactor),
+            "next_review_date": next_review_date
+        }
+
+    @staticmethod
+    def _round4(values):
+        """np.round(values, 4), with near-halfway ties re-rounded by Python's round()."""
+        rounded = np.round(values, 4)
+        # np.round scales by 10**4 and can disagree with round() exactly at ties
+        scaled = values * 10_000
+        tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+        if tie.any():
+            rounded[tie] = [round(float(v), 4) for v in values[tie]]
+        return rounded
+
+SCHEDULERS = ("sm2", "fsrs")
+
+# FSRS engine loaded from the params file, reused until the file changes
+_fsrs_engine = None  # (params file mtime or None, engine)
+_fsrs_lock = threading.Lock()
+
+def _load_fsrs():
+    global _fsrs_engine
+    from fsrs_engine import FSRSEngine, PARAMS_PATH
+    try:
+        mtime = os.stat(PARAMS_PATH).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    with _fsrs_lock:
+        if _fsrs_engine is None or _fsrs_engine[0] != mtime:
+            _fsrs_engine = (mtime, FSRSEngine.load(PARAMS_PATH))
+        return _fsrs_engine[1]
+
+def get_scheduler(name="sm2"):
+    """
+    Returns the scheduler engine for `name`.
+
+    Every engine exposes schedule(card, quality) returning at least
+    interval / repetition / efactor / next_review_date. The FSRS engine is
+    cached and reloaded only when its fitted-params file changes.
+    """
+    if name == "fsrs":
+        return _load_fsrs()
+    if name == "sm2":
+        return SRSEngine
+    raise ValueError(f"Unknown scheduler: {name} (expected one of {SCHEDULERS})")
+
 if __name__ == "__main__":
     # Simple Test
     print("Testing SM-2 Algorithm...")
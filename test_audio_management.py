@@ -13,8 +13,8 @@ import os
 # 添加專案路徑
 sys.path.insert(0, os.path.dirname(__file__))
 
-from audio_manager import generate_audio
-import hashlib
+from audio_manager import audio_key, generate_audio
+from audio_cache import get_audio_cache
 
 def test_audio_generation():
     print("=" * 60)
@@ -33,14 +33,13 @@ def test_audio_generation():
     
     for i, sentence in enumerate(test_sentences, 1):
         # 計算預期的檔名
-        audio_key = hashlib.md5(sentence.encode('utf-8')).hexdigest()
-        expected_filename = f"{audio_key}.mp3"
+        expected_filename = f"{audio_key(sentence)}.mp3"
         
         print(f"\n測試 {i}: {sentence}")
         print(f"預期檔名: {expected_filename}")
         
         # 生成音檔
-        audio_path = generate_audio(sentence, expected_filename)
+        audio_path = generate_audio(sentence)
         
         if audio_path and os.path.exists(audio_path):
             file_size = os.path.getsize(audio_path)
@@ -55,17 +54,14 @@ def test_audio_generation():
     
     # 再次生成第一個句子
     sentence1 = test_sentences[0]
-    audio_key1 = hashlib.md5(sentence1.encode('utf-8')).hexdigest()
-    filename1 = f"{audio_key1}.mp3"
-    
     print(f"\n再次生成: {sentence1}")
     print("預期行為: 應該直接重複使用，不重新生成")
     
-    audio_path = generate_audio(sentence1, filename1)
+    audio_path = generate_audio(sentence1)
     
     if audio_path:
         print(f"✅ 路徑返回: {audio_path}")
-        print("   (檢查終端輸出，應顯示 'File already exists, reusing')")
+        print("   (檢查終端輸出，應顯示 'Cache hit, reusing')")
     else:
         print("❌ 失敗")
     
@@ -75,14 +71,19 @@ def test_audio_generation():
     
     temp_audio_dir = os.path.join(os.path.dirname(__file__), "temp_audio")
     if os.path.exists(temp_audio_dir):
-        files = [f for f in os.listdir(temp_audio_dir) if f.endswith('.mp3')]
+        # Clips are stored in shard directories (temp_audio/ab/cd/<key>.mp3)
+        files = [
+            os.path.join(root, f)
+            for root, _, names in os.walk(temp_audio_dir)
+            for f in names if f.endswith('.mp3')
+        ]
         print(f"\n音檔總數: {len(files)}")
         print(f"預期數量: 2 (因為第 1 和第 3 個句子相同)")
+        print(f"快取索引: {get_audio_cache().stats()}")
         
-        for file in files[:5]:  # 只顯示前 5 個
-            filepath = os.path.join(temp_audio_dir, file)
+        for filepath in files[:5]:  # 只顯示前 5 個
             size = os.path.getsize(filepath)
-            print(f"  - {file} ({size} bytes)")
+            print(f"  - {os.path.relpath(filepath, temp_audio_dir)} ({size} bytes)")
         
         if len(files) == 2:
             print("\n✅ 驗證通過！音檔數量正確")
@@ -0,0 +1,177 @@
+"""
+預測未來的複習量（與 Gemini / TTS 呼叫量）
+
+以目前 user_progress 的排程狀態為起點，加上每日新卡片數，
+用 SRSEngine 的批次 SM-2 進行 Monte-Carlo 模擬，輸出每日負載的百分位數。
+
+Usage:
+    python workload_simulator.py --days 90 --trials 2000 --new-per-day 10
+    python workload_simulator.py --csv forecast.csv --workers 4
+"""
+
+import argparse
+import csv
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+import numpy as np
+
+from srs_engine import SRSEngine
+
+# Used when review_logs has no history yet (quality 0..5)
+DEFAULT_QUALITY_DIST = [0.05, 0.05, 0.10, 0.30, 0.30, 0.20]
+PERCENTILES = (10, 50, 90, 99)
+
+# API calls caused by one review: lesson generation + answer evaluation, one TTS clip
+LLM_CALLS_PER_REVIEW = 2
+TTS_CALLS_PER_REVIEW = 1
+
+
+def load_state(db):
+    """
+    Current schedule from the database.
+
+    Returns:
+        dict: arrays for active cards (days until due, repetition, efactor, interval),
+              the number of new cards and the empirical quality distribution.
+    """
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT julianday(next_review_due) - julianday(?), repetition_streak, efactor, interval
+            FROM user_progress
+            WHERE status = 'active' AND next_review_due IS NOT NULL
+        ''', (datetime.now().date().isoformat(),))
+        rows = cursor.fetchall()
+
+        cursor.execute("SELECT COUNT(*) FROM user_progress WHERE status = 'new'")
+        new_count = cursor.fetchone()[0]
+
+        cursor.execute('SELECT quality_rating, COUNT(*) FROM review_logs GROUP BY quality_rating')
+        counts = np.zeros(6)
+        for quality, count in cursor.fetchall():
+            if 0 <= quality <= 5:
+                counts[quality] = count
+        quality_dist = counts / counts.sum() if counts.sum() else np.array(DEFAULT_QUALITY_DIST)
+
+        rows = np.array(rows, dtype=np.float64).reshape(-1, 4)
+        return {
+            "due_in": np.floor(rows[:, 0]),
+            "repetition": rows[:, 1].astype(np.int64),
+            "efactor": rows[:, 2],
+            "interval": rows[:, 3].astype(np.int64),
+            "new_count": new_count,
+            "quality_dist": quality_dist
+        }
+
+
+def simulate(state, days, trials, new_per_day, seed=0):
+    """
+    Monte-Carlo simulation of daily review counts, vectorized over trials x cards.
+
+    Returns:
+        np.ndarray: (trials, days) reviews per day (new cards included).
+    """
+    rng = np.random.default_rng(seed)
+    intake = min(state['new_count'], new_per_day * days)
+
+    # Active cards followed by the new cards introduced during the simulation
+    due_day = np.concatenate([state['due_in'], np.arange(intake) // max(new_per_day, 1)])
+    repetition = np.concatenate([state['repetition'], np.zeros(intake, dtype=np.int64)])
+    efactor = np.concatenate([state['efactor'], np.full(intake, 2.5)])
+    interval = np.concatenate([state['interval'], np.zeros(intake, dtype=np.int64)])
+
+    # One row per trial
+    due_day = np.tile(due_day, (trials, 1))
+    repetition = np.tile(repetition, (trials, 1))
+    efactor = np.tile(efactor, (trials, 1))
+    interval = np.tile(interval, (trials, 1))
+
+    load = np.zeros((trials, days), dtype=np.int64)
+    for day in range(days):
+        due = due_day <= day
+        load[:, day] = due.sum(axis=1)
+        n_due = int(load[:, day].sum())
+        if not n_due:
+            continue
+
+        quality = rng.choice(6, size=n_due, p=state['quality_dist'])
+        result = SRSEngine.calculate_reviews_batch(quality, repetition[due], efactor[due], interval[due])
+        repetition[due] = result['repetition']
+        efactor[due] = result['efactor']
+        interval[due] = result['interval']
+        due_day[due] = day + result['interval']
+
+    return load
+
+
+def _simulate_chunk(args):
+    state, days, trials, new_per_day, seed = args
+    return simulate(state, days, trials, new_per_day, seed)
+
+
+def forecast(state, days=90, trials=2000, new_per_day=10, workers=1, seed=0):
+    """Runs the simulation (split across worker processes) and returns per-day percentiles."""
+    chunks = max(workers, 1)
+    sizes = [trials // chunks + (1 if i < trials % chunks else 0) for i in range(chunks)]
+    jobs = [(state, days, size, new_per_day, seed + i) for i, size in enumerate(sizes) if size]
+
+    if workers > 1:
+        with Pool(processes=workers) as pool:
+            loads = pool.map(_simulate_chunk, jobs)
+    else:
+        loads = [_simulate_chunk(job) for job in jobs]
+    load = np.concatenate(loads, axis=0)
+
+    return {p: np.percentile(load, p, axis=0) for p in PERCENTILES}
+
+
+def print_report(percentiles, days, start=None):
+    start = start or datetime.now().date()
+    header = "date        " + "".join(f"  p{p:<5}" for p in PERCENTILES) + "  LLM(p90)  TTS(p90)"
+    print(header)
+    print("-" * len(header))
+    for day in range(days):
+        values = "".join(f"  {percentiles[p][day]:<6.0f}" for p in PERCENTILES)
+        p90 = percentiles[90][day]
+        print(f"{start + timedelta(days=day)}{values}  {p90 * LLM_CALLS_PER_REVIEW:<8.0f}  {p90 * TTS_CALLS_PER_REVIEW:<8.0f}")
+
+    peak = percentiles[99].max()
+    print(f"\nPeak p99: {peak:.0f} reviews/day "
+          f"(~{peak * LLM_CALLS_PER_REVIEW:.0f} LLM calls, ~{peak * TTS_CALLS_PER_REVIEW:.0f} TTS calls)")
+
+
+def write_csv(path, percentiles, days, start=None):
+    start = start or datetime.now().date()
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["date"] + [f"p{p}" for p in PERCENTILES])
+        for day in range(days):
+            writer.writerow([start + timedelta(days=day)] + [round(float(percentiles[p][day]), 1) for p in PERCENTILES])
+
+
+def main():
+    from database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Forecast daily review / API load from user_progress.")
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--trials", type=int, default=2000)
+    parser.add_argument("--new-per-day", type=int, default=10, help="New cards introduced per day")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--csv", help="Also write percentiles to this CSV file")
+    args = parser.parse_args()
+
+    state = load_state(DatabaseManager())
+    print(f"Active cards: {len(state['due_in'])}, new cards: {state['new_count']}, "
+          f"intake: {args.new_per_day}/day, trials: {args.trials}\n")
+
+    percentiles = forecast(state, args.days, args.trials, args.new_per_day, args.workers, args.seed)
+    print_report(percentiles, args.days)
+    if args.csv:
+        write_csv(args.csv, percentiles, args.days)
+        print(f"Saved to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()